@@ -1,34 +1,61 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from models import db, User, HealthRecord, Prediction
-from ml_model import predict_health_risk, get_health_recommendations, get_predicted_conditions, health_predictor
+from flask import Flask, Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, abort, current_app
+from flask import Response, stream_with_context
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
+from sqlalchemy.orm import selectinload
+from models import db, User, HealthRecord, Prediction, HealthRollup, HealthBaseline, migrate_schema, \
+    bump_data_version
+from models import VITAL_FIELDS, TEXT_FIELDS, parse_vital
+from rollups import update_rollups, rebuild_rollups, period_start
+from baselines import update_baselines, rebuild_baselines, format_anomalies, parse_anomalies, \
+    trajectory, METRIC_LABELS
+from pagination import keyset_paginate
+import archive
+import response_cache
+import i18n
+import metrics
+import model_registry
+from database import database_uri, engine_options, configure_engine
+from prediction_worker import prediction_worker
+from passwords import password_hasher, PasswordHasherBusy
+from bulk_io import FORMATS, format_for, iter_rows, import_records, export_records
+from response_cache import versioned_json, cached_fragment
+from ml_model import analyze_health, analyze_health_batch, health_predictor, prediction_cache, \
+    HealthRiskPredictor, MODEL_PATH
 import os
+import csv
+import hmac
+import io
+import click
+from flask.cli import with_appcontext
+from jinja2 import FileSystemBytecodeCache
 from datetime import datetime, timedelta
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'smart-health-assistant-secret-key-2023'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///health_assistant.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db.init_app(app)
+main = Blueprint('main', __name__)
 
 # Flask-Login setup
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'main.login'
 login_manager.login_message = 'Please log in to access this page.'
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-# Initialize database and ML model
-with app.app_context():
+def init_db(upgrade=False):
+    """Create missing tables and the default admin account, and with
+    upgrade bring existing tables up to date with the models"""
     db.create_all()
-    # Create admin user if not exists
-    admin_user = User.query.filter_by(email='admin@health.com').first()
-    if not admin_user:
+    if upgrade:
+        # Schema upgrades (new columns and indexes, table rebuilds) and the
+        # archive id reservation copy or scan whole tables, so like the
+        # backfills in init_db_command they run only from `flask init-db`,
+        # not in every worker's create_app
+        for name in migrate_schema():
+            print(f"Created {name}")
+        archive.reserve_ids()
+    # Create admin user if not exists (only the id is read, which a
+    # database that still needs upgrading has too)
+    if db.session.query(User.id).filter_by(email='admin@health.com').first() is None:
         admin_user = User(
             username='admin',
             email='admin@health.com',
@@ -39,21 +66,384 @@ with app.app_context():
         admin_user.set_password('admin123')
         db.session.add(admin_user)
         db.session.commit()
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create or upgrade database tables and the default admin account."""
+    init_db(upgrade=True)
+    # Backfill trend rollups for databases created before they existed.
+    # Only here, not in create_app, so workers starting together on the
+    # first deploy do not all rebuild them at once.
+    if HealthRollup.query.first() is None and HealthRecord.query.first() is not None:
+        click.echo(f'Built trend rollups from {rebuild_rollups()} health records.')
+    # ... and the per-user baselines behind anomaly flags
+    if HealthBaseline.query.first() is None and HealthRecord.query.first() is not None:
+        click.echo(f'Built health baselines from {rebuild_baselines()} health records.')
+    # A fresh checkout only has the unversioned pickle; publish it with a
+    # compiled export so workers serve the forest without importing sklearn
+    if model_registry.current_version() is None and os.path.exists(MODEL_PATH):
+        version = HealthRiskPredictor(backend='sklearn').export_compiled()
+        click.echo(f'Published model version {version} with a compiled export.')
+    click.echo('Initialized the database.')
+
+@click.command('rebuild-rollups')
+@click.option('--user-id', type=int, help='Only rebuild this user\'s rollups.')
+@with_appcontext
+def rebuild_rollups_command(user_id):
+    """Recompute daily and weekly trend rollups from health records."""
+    count = rebuild_rollups(user_id)
+    click.echo(f'Rebuilt rollups from {count} health records.')
+
+@click.command('rebuild-baselines')
+@click.option('--user-id', type=int, help='Only rebuild this user\'s baseline.')
+@with_appcontext
+def rebuild_baselines_command(user_id):
+    """Recompute per-user vital baselines from health records."""
+    count = rebuild_baselines(user_id)
+    click.echo(f'Rebuilt baselines from {count} health records.')
+
+@click.command('archive-records')
+@click.option('--older-than-days', type=int,
+              help='Archive whole months before this age (default: ARCHIVE_AFTER_DAYS).')
+@with_appcontext
+def archive_records_command(older_than_days):
+    """Move old health records into the columnar archive."""
+    if older_than_days is None:
+        older_than_days = current_app.config['ARCHIVE_AFTER_DAYS']
+    cutoff = archive.archive_cutoff(older_than_days)
+    count = archive.archive_records(cutoff)
+    click.echo(f'Archived {count} health records recorded before {cutoff:%Y-%m-%d}.')
+
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates_command():
+    """Compile every template into the bytecode cache."""
+    names = current_app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        current_app.jinja_env.get_template(name)
+    click.echo(f'Compiled {len(names)} templates.')
+
+@click.command('import-records')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS),
+              help='File format (default: from the file extension).')
+@click.option('--user-id', type=int, help='Owner of rows without a user_id column.')
+@click.option('--predict', is_flag=True, help='Score the imported records with the model.')
+@click.option('--chunk-size', type=int, default=5000, show_default=True)
+@with_appcontext
+def import_records_command(path, fmt, user_id, predict, chunk_size):
+    """Bulk import health records from a CSV or JSONL file."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        result = import_records(iter_rows(f, fmt or format_for(path)), default_user_id=user_id,
+                                predict=predict, chunk_size=chunk_size)
+    for error in result['errors']:
+        click.echo(f"Row {error['row']}: {error['error']}", err=True)
+    click.echo(f"Imported {result['imported']} records ({result['predicted']} scored), "
+               f"skipped {result['failed']} rows.")
+
+@click.command('export-records')
+@click.option('--output', type=click.File('w'), default='-', help='Output file (default: stdout).')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='csv', show_default=True)
+@click.option('--user-id', type=int, help='Only export this user\'s records.')
+@with_appcontext
+def export_records_command(output, fmt, user_id):
+    """Export health records and predictions as CSV or JSONL."""
+    for chunk in export_records(user_id, fmt):
+        output.write(chunk)
+
+def configure_templates(app):
+    """Keep compiled templates in a bytecode cache, so a fresh worker loads
+    them instead of parsing and compiling every template again"""
+    location = app.config['TEMPLATE_BYTECODE_CACHE']
+    if location == 'none':
+        return
+    if location != 'tmp':
+        os.makedirs(location, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(None if location == 'tmp' else location)
+
+def create_app(test_config=None):
+    """Application factory.
+
+    Nothing expensive happens here: the ML model is loaded lazily on the
+    first prediction or warmed up in a background thread, and database
+    bootstrapping can be moved to `flask init-db` by setting
+    CARENEST_INIT_DB=0.
+    """
+    app = Flask(__name__)
+    app.config.from_mapping(
+        SECRET_KEY='smart-health-assistant-secret-key-2023',
+        SQLALCHEMY_DATABASE_URI=database_uri(),
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # Run create_all/admin seeding when the app is created
+        INIT_DB=os.environ.get('CARENEST_INIT_DB', '1') == '1',
+        # 'background' loads the model in a thread at startup, 'lazy' on first use
+        MODEL_WARMUP=os.environ.get('CARENEST_MODEL_WARMUP', 'background'),
+        # 'sync' scores submissions inside the request, 'async' hands them to
+        # the background prediction worker
+        PREDICTION_MODE=os.environ.get('CARENEST_PREDICTION_MODE', 'sync'),
+        # werkzeug method string for new password hashes; existing hashes
+        # are upgraded on the user's next login
+        PASSWORD_HASH_METHOD=os.environ.get('CARENEST_PASSWORD_HASH_METHOD', 'scrypt'),
+        # Server-side cache behind the ETag'd JSON endpoints: 'memory',
+        # 'none' or 'module:Class' for a custom backend
+        RESPONSE_CACHE=os.environ.get('CARENEST_RESPONSE_CACHE', 'memory'),
+        RESPONSE_CACHE_SIZE=int(os.environ.get('CARENEST_RESPONSE_CACHE_SIZE', '1024')),
+        RESPONSE_CACHE_TTL=int(os.environ.get('CARENEST_RESPONSE_CACHE_TTL', '3600')),
+        # Bearer token Prometheus sends to GET /metrics; unset, only
+        # logged-in admins can read it
+        METRICS_TOKEN=os.environ.get('CARENEST_METRICS_TOKEN'),
+        # Fraction of requests run under cProfile, with stats saved to PROFILE_DIR
+        PROFILE_SAMPLE_RATE=float(os.environ.get('CARENEST_PROFILE_SAMPLE_RATE', '0')),
+        PROFILE_DIR=os.environ.get('CARENEST_PROFILE_DIR',
+                                   os.path.join(app.instance_path, 'profiles')),
+        # Columnar archive of records older than ARCHIVE_AFTER_DAYS, written
+        # by `flask archive-records`
+        ARCHIVE_DIR=os.environ.get('CARENEST_ARCHIVE_DIR',
+                                   os.path.join(app.instance_path, 'archive')),
+        ARCHIVE_AFTER_DAYS=int(os.environ.get('CARENEST_ARCHIVE_AFTER_DAYS', '365')),
+        # Compiled gettext catalogs (translations/<locale>/LC_MESSAGES/messages.mo)
+        TRANSLATIONS_DIR=os.environ.get('CARENEST_TRANSLATIONS_DIR',
+                                        os.path.join(app.root_path, 'translations')),
+        DEFAULT_LOCALE=os.environ.get('CARENEST_DEFAULT_LOCALE', 'en'),
+        # Where compiled templates are cached across worker starts: a
+        # directory, 'tmp' for Jinja's per-user temp directory or 'none'
+        TEMPLATE_BYTECODE_CACHE=os.environ.get('CARENEST_TEMPLATE_BYTECODE_CACHE', 'tmp')
+    )
+    if test_config:
+        app.config.update(test_config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    
+    db.init_app(app)
+    with app.app_context():
+        configure_engine(db.engine)
+        metrics.init_app(app, db.engine)
+    login_manager.init_app(app)
+    response_cache.init_app(app)
+    i18n.init_app(app)
+    configure_templates(app)
+    metrics.register_stats('prediction_cache', prediction_cache.stats)
+    metrics.register_stats('response_cache', response_cache.stats)
+    metrics.register_stats('password_hasher', password_hasher.stats)
+    app.register_blueprint(main)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(rebuild_baselines_command)
+    app.cli.add_command(archive_records_command)
+    app.cli.add_command(compile_templates_command)
+    app.cli.add_command(import_records_command)
+    app.cli.add_command(export_records_command)
+    
+    if app.config['INIT_DB']:
+        with app.app_context():
+            init_db()
+    
+    if app.config['MODEL_WARMUP'] == 'background':
+        health_predictor.warm_up()
+    
+    if app.config['PREDICTION_MODE'] == 'async':
+        prediction_worker.init_app(app)
+        prediction_worker.start()
+        metrics.register_stats('prediction_worker', prediction_worker.stats)
     
-    # Load ML model
-    health_predictor.load_model()
+    return app
+
+def parse_health_data(source, age):
+    """Build a health_data dict from a form or uploaded row"""
+    health_data = {name: parse_vital(name, source[name]) for name in VITAL_FIELDS}
+    health_data['age'] = age
+    for name in TEXT_FIELDS:
+        health_data[name] = source.get(name) or ''
+    return health_data
+
+def build_health_record(user_id, health_data):
+    """Create a HealthRecord from a health_data dict"""
+    return HealthRecord(
+        user_id=user_id,
+        **{name: health_data[name] for name in list(VITAL_FIELDS) + TEXT_FIELDS}
+    )
+
+# Trend windows accepted by /api/health-trends, in days
+TREND_RANGES = {'30d': 30, '90d': 90, '1y': 365, '5y': 1825}
+
+HISTORY_PER_PAGE = 10
+ADMIN_USERS_PER_PAGE = 50
+MAX_API_PAGE_SIZE = 100
+
+def page_size(default):
+    """Page size from ?limit=, capped for the JSON endpoints"""
+    return max(1, min(request.args.get('limit', default, type=int), MAX_API_PAGE_SIZE))
+
+def history_page(user_id, per_page):
+    """Keyset page of a user's records, live and archived, newest first,
+    cursor on (recorded_at, id)"""
+    # Load the page's predictions in one extra query instead of one per row
+    query = HealthRecord.query.filter_by(user_id=user_id)\
+        .options(selectinload(HealthRecord.prediction))
+    try:
+        return keyset_paginate(query, [HealthRecord.recorded_at, HealthRecord.id], per_page,
+                               after=request.args.get('after'), before=request.args.get('before'),
+                               extra=lambda values, greater, limit:
+                                   archive.page(user_id, values, greater, limit))
+    except ValueError:
+        abort(400)
+
+def admin_user_page(search, per_page):
+    """Keyset page of users ordered by id, optionally filtered by name or email"""
+    query = User.query
+    if search:
+        needle = search.lower()
+        query = query.filter(db.or_(
+            db.func.lower(User.username).contains(needle, autoescape=True),
+            db.func.lower(User.email).contains(needle, autoescape=True)
+        ))
+    try:
+        return keyset_paginate(query, [User.id], per_page, descending=False,
+                               after=request.args.get('after'), before=request.args.get('before'))
+    except ValueError:
+        abort(400)
+
+def record_counts_for(user_ids):
+    """Health record count per user for the given users, in one grouped
+    query plus the archive indexes"""
+    counts = dict(
+        db.session.query(HealthRecord.user_id, db.func.count(HealthRecord.id))
+        .filter(HealthRecord.user_id.in_(user_ids))
+        .group_by(HealthRecord.user_id)
+        .all()
+    )
+    for user_id, count in archive.record_counts(user_ids).items():
+        counts[user_id] = counts.get(user_id, 0) + count
+    return counts
+
+def serialize_record(record):
+    prediction = record.prediction[0] if record.prediction else None
+    return {
+        'id': record.id,
+        'recorded_at': record.recorded_at.isoformat(),
+        **{name: getattr(record, name) for name in list(VITAL_FIELDS) + TEXT_FIELDS},
+        'anomalies': [{'metric': label, 'z_score': z} for label, z in parse_anomalies(record.anomalies)],
+        'prediction': {
+            'risk_level': prediction.risk_level,
+            'confidence': prediction.confidence_score,
+            'predicted_conditions': prediction.predicted_conditions,
+            'recommendations': prediction.recommendations,
+            'model_version': prediction.model_version
+        } if prediction else None
+    }
+
+def serialize_user(user, record_count):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'age': user.age,
+        'gender': user.gender,
+        'is_admin': user.is_admin,
+        'created_at': user.created_at.isoformat() if user.created_at else None,
+        'record_count': record_count
+    }
+
+def own_health_record(record_id):
+    """A health record of the current user (any record for admins), or 404"""
+    record = HealthRecord.query.get_or_404(record_id)
+    if record.user_id != current_user.id and not current_user.is_admin:
+        abort(404)
+    return record
+
+def analysis_data(record, prediction):
+    """Template context for analysis.html from a stored record and prediction"""
+    return {
+        'risk_level': prediction.risk_level,
+        'confidence': prediction.confidence_score,
+        'recommendations': prediction.recommendations.split('; ') if prediction.recommendations else [],
+        'predicted_conditions': prediction.predicted_conditions.split(', ')
+            if prediction.predicted_conditions else [],
+        'health_data': {name: getattr(record, name) for name in list(VITAL_FIELDS) + TEXT_FIELDS},
+        'anomalies': parse_anomalies(record.anomalies)
+    }
+
+def flash_anomalies(anomalies):
+    """Warn about readings far from the user's own baseline"""
+    if anomalies:
+        readings = ', '.join(f"{METRIC_LABELS[metric]} ({'above' if z > 0 else 'below'} usual)"
+                             for metric, z in anomalies.items())
+        flash(f'Unusual readings compared with your history: {readings}.', 'warning')
+
+def remember_analysis(record_id):
+    """Point /analysis at a record; the result itself stays in the database
+    so the session cookie sent with every request stays small"""
+    session.pop('last_prediction', None)  # full payload stored by older versions
+    session['last_health_record_id'] = record_id
+
+def risk_counts_for(user_id):
+    """Number of low/medium/high predictions for a user, counted in SQL
+    and in the archive"""
+    counts = dict(
+        db.session.query(Prediction.risk_level, db.func.count(Prediction.id))
+        .filter(Prediction.user_id == user_id)
+        .group_by(Prediction.risk_level)
+        .all()
+    )
+    for risk_level, count in archive.risk_counts(user_id).items():
+        counts[risk_level] = counts.get(risk_level, 0) + count
+    return counts
 
 # Routes
-@app.route('/')
+@main.route('/health/live')
+def liveness():
+    return jsonify({'status': 'alive'})
+
+@main.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for this worker process.
+
+    Route names, SQL counts and cache and worker stats are operational
+    details, so scrapers must send `Authorization: Bearer <METRICS_TOKEN>`;
+    logged-in admins may read it too.
+    """
+    token = current_app.config['METRICS_TOKEN']
+    supplied = request.headers.get('Authorization', '')
+    authorized = (bool(token) and hmac.compare_digest(supplied.encode(),
+                                                      f'Bearer {token}'.encode())) \
+        or (current_user.is_authenticated and current_user.is_admin)
+    if not authorized:
+        return jsonify({'error': 'Admin privileges or the metrics token required'}), 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@main.route('/health/ready')
+def readiness():
+    """Report whether this worker can serve predictions"""
+    try:
+        db.session.execute(db.text('SELECT 1'))
+        database_ok = True
+    except Exception:
+        database_ok = False
+    
+    if not health_predictor.is_trained:
+        # Make sure a lazily configured worker starts loading the model
+        health_predictor.warm_up()
+    
+    ready = database_ok and health_predictor.is_trained
+    return jsonify({
+        'status': 'ready' if ready else 'starting',
+        'database': database_ok,
+        'model_loaded': health_predictor.is_trained,
+        'model_backend': health_predictor.active_backend,
+        'model_version': health_predictor.model_version
+    }), 200 if ready else 503
+
+@main.route('/')
 def index():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     return render_template('index.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@main.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     if request.method == 'POST':
         username = request.form['username']
@@ -77,46 +467,71 @@ def register():
             gender=gender,
             is_admin=False
         )
-        new_user.set_password(password)
+        try:
+            new_user.set_password(password)
+        except PasswordHasherBusy:
+            flash('The server is busy, please try again in a moment.', 'error')
+            return render_template('register.html'), 503
         
         db.session.add(new_user)
         db.session.commit()
         
         flash('Registration successful! Please login with your credentials.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     return render_template('register.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     if request.method == 'POST':
         email = request.form['email']
         password = request.form['password']
         user = User.query.filter_by(email=email).first()
         
-        if user and user.check_password(password):
+        try:
+            if user is None:
+                # Hash anyway so unknown emails take as long as wrong passwords
+                valid = password_hasher.verify(None, password)
+            else:
+                valid = user.check_password(password)
+        except PasswordHasherBusy:
+            flash('The server is busy, please try again in a moment.', 'error')
+            return render_template('login.html'), 503
+        
+        if valid:
+            # Saves the upgraded hash if check_password rehashed it
+            db.session.commit()
             login_user(user)
             next_page = request.args.get('next')
             flash(f'Welcome back, {user.username}!', 'success')
-            return redirect(next_page) if next_page else redirect(url_for('dashboard'))
+            return redirect(next_page) if next_page else redirect(url_for('main.dashboard'))
         else:
             flash('Invalid email or password! Please try again.', 'error')
     
     return render_template('login.html')
 
-@app.route('/logout')
+@main.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out successfully.', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/dashboard')
+@main.route('/dashboard')
 @login_required
 def dashboard():
+    # The cards below the header only change with the user's data, so they
+    # are rendered (and queried) once per data version and locale
+    summary = cached_fragment(
+        ('dashboard', current_user.id, current_user.data_version, i18n.get_locale()),
+        render_dashboard_summary
+    )
+    return render_template('dashboard.html', summary=summary)
+
+def render_dashboard_summary():
     # Get recent health records
     recent_records = HealthRecord.query.filter_by(user_id=current_user.id)\
         .order_by(HealthRecord.recorded_at.desc())\
@@ -127,56 +542,49 @@ def dashboard():
         .order_by(Prediction.predicted_at.desc())\
         .limit(5).all()
     
-    return render_template('dashboard.html', 
+    # Long-run averages and direction of each vital, from the running baseline
+    baseline = trajectory(db.session.get(HealthBaseline, current_user.id))
+    
+    return render_template('dashboard_summary.html', 
                          recent_records=recent_records,
-                         recent_predictions=recent_predictions)
+                         recent_predictions=recent_predictions,
+                         baseline=baseline)
 
-@app.route('/input-health', methods=['GET', 'POST'])
+@main.route('/input-health', methods=['GET', 'POST'])
 @login_required
 def input_health():
     if request.method == 'POST':
         try:
             # Get form data
-            health_data = {
-                'weight': float(request.form['weight']),
-                'height': float(request.form['height']),
-                'systolic_bp': int(request.form['systolic_bp']),
-                'diastolic_bp': int(request.form['diastolic_bp']),
-                'heart_rate': int(request.form['heart_rate']),
-                'blood_sugar': float(request.form['blood_sugar']),
-                'cholesterol': float(request.form['cholesterol']),
-                'sleep_hours': float(request.form['sleep_hours']),
-                'age': current_user.age,
-                'symptoms': request.form.get('symptoms', ''),
-                'medication': request.form.get('medication', ''),
-                'allergies': request.form.get('allergies', ''),
-                'exercise_frequency': request.form.get('exercise_frequency', '')
-            }
+            health_data = parse_health_data(request.form, current_user.age)
+            
+            scored_later = current_app.config['PREDICTION_MODE'] == 'async'
+            if not scored_later:
+                # Predict health risk before writing anything, so the
+                # database write lock is not held during inference
+                model = health_predictor.snapshot()
+                risk_level, confidence, recommendations, predicted_conditions = \
+                    analyze_health(health_data, model)
             
             # Create health record
-            health_record = HealthRecord(
-                user_id=current_user.id,
-                weight=health_data['weight'],
-                height=health_data['height'],
-                systolic_bp=health_data['systolic_bp'],
-                diastolic_bp=health_data['diastolic_bp'],
-                heart_rate=health_data['heart_rate'],
-                blood_sugar=health_data['blood_sugar'],
-                cholesterol=health_data['cholesterol'],
-                sleep_hours=health_data['sleep_hours'],
-                symptoms=health_data['symptoms'],
-                medication=health_data['medication'],
-                allergies=health_data['allergies'],
-                exercise_frequency=health_data['exercise_frequency']
-            )
+            health_record = build_health_record(current_user.id, health_data)
+            # Compare with the user's own baseline and fold the reading in
+            anomalies = update_baselines([health_record])[0]
+            health_record.anomalies = format_anomalies(anomalies)
             
             db.session.add(health_record)
             db.session.flush()  # Get the ID before commit
+            update_rollups([health_record])
+            bump_data_version([current_user.id])
             
-            # Predict health risk
-            risk_level, confidence = predict_health_risk(health_data)
-            recommendations = get_health_recommendations(risk_level, health_data)
-            predicted_conditions = get_predicted_conditions(risk_level, health_data)
+            if scored_later:
+                # Store the reading now and let the worker score it
+                db.session.commit()
+                prediction_worker.enqueue([health_record.id])
+                remember_analysis(health_record.id)
+                flash('Health data submitted successfully! Analysis in progress.', 'success')
+                flash_anomalies(anomalies)
+                return redirect(url_for('main.analysis'))
             
             # Create prediction record
             prediction = Prediction(
@@ -185,22 +593,17 @@ def input_health():
                 risk_level=risk_level,
                 predicted_conditions=', '.join(predicted_conditions),
                 confidence_score=confidence,
-                recommendations='; '.join(recommendations)
+                recommendations='; '.join(recommendations),
+                model_version=model.version if model else None
             )
             
             db.session.add(prediction)
             db.session.commit()
-            
-            session['last_prediction'] = {
-                'risk_level': risk_level,
-                'confidence': confidence,
-                'recommendations': recommendations,
-                'predicted_conditions': predicted_conditions,
-                'health_data': health_data
-            }
+            remember_analysis(health_record.id)
             
             flash('Health data submitted successfully! Analysis completed.', 'success')
-            return redirect(url_for('analysis'))
+            flash_anomalies(anomalies)
+            return redirect(url_for('main.analysis'))
             
         except Exception as e:
             db.session.rollback()
@@ -209,84 +612,365 @@ def input_health():
     
     return render_template('input_form.html')
 
-from datetime import datetime
-
-@app.route('/analysis')
+@main.route('/analysis')
 @login_required
 def analysis():
-    prediction_data = session.get('last_prediction')
-    if not prediction_data:
+    record_id = session.get('last_health_record_id')
+    if not record_id:
+        flash('No recent analysis found. Please submit health data first.', 'warning')
+        return redirect(url_for('main.dashboard'))   # or wherever you want to redirect
+    
+    record = HealthRecord.query.options(selectinload(HealthRecord.prediction)).get(record_id)
+    if record is None or record.user_id != current_user.id:
+        session.pop('last_health_record_id', None)
         flash('No recent analysis found. Please submit health data first.', 'warning')
-        return redirect(url_for('dashboard'))   # or wherever you want to redirect
+        return redirect(url_for('main.dashboard'))
+    if not record.prediction:
+        # Still queued for the async prediction worker
+        return render_template('analysis_pending.html', record=record)
 
     # ✅ Pass 'now' to the template
     return render_template(
         'analysis.html',
         now=datetime.now(),
-        **prediction_data
+        **analysis_data(record, record.prediction[0])
     )
 
-@app.route('/history')
+@main.route('/api/health-records/<int:record_id>/prediction')
+@login_required
+def prediction_status(record_id):
+    """Whether a submitted record has been scored yet, with the result if so"""
+    record = own_health_record(record_id)
+    if not record.prediction:
+        return jsonify({'health_record_id': record.id, 'status': 'pending'}), 202
+    return jsonify({'health_record_id': record.id, 'status': 'complete',
+                    **serialize_record(record)['prediction']})
+
+@main.route('/history')
 @login_required
 def history():
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
+    health_records = history_page(current_user.id, HISTORY_PER_PAGE)
+    record_count = record_counts_for([current_user.id]).get(current_user.id, 0)
     
-    health_records = HealthRecord.query.filter_by(user_id=current_user.id)\
-        .order_by(HealthRecord.recorded_at.desc())\
-        .paginate(page=page, per_page=per_page, error_out=False)
-    
-    return render_template('history.html', health_records=health_records)
+    return render_template('history.html', health_records=health_records,
+                           record_count=record_count,
+                           risk_counts=risk_counts_for(current_user.id))
+
+@main.route('/api/history')
+@login_required
+@versioned_json
+def history_api():
+    page = history_page(current_user.id, page_size(HISTORY_PER_PAGE))
+    return jsonify({
+        'records': [serialize_record(record) for record in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor
+    })
 
-@app.route('/api/health-trends')
+@main.route('/api/health-trends')
 @login_required
+@versioned_json
 def health_trends():
-    # Get health records from last 30 days
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    records = HealthRecord.query.filter(
-        HealthRecord.user_id == current_user.id,
-        HealthRecord.recorded_at >= thirty_days_ago
-    ).order_by(HealthRecord.recorded_at).all()
-    
-    data = {
-        'dates': [r.recorded_at.strftime('%Y-%m-%d') for r in records],
-        'systolic_bp': [r.systolic_bp for r in records],
-        'diastolic_bp': [r.diastolic_bp for r in records],
-        'heart_rate': [r.heart_rate for r in records],
-        'blood_sugar': [r.blood_sugar for r in records]
-    }
+    """Vitals over time, read from the daily/weekly rollups.
+
+    ?range= is one of TREND_RANGES (default 30d) and ?resolution= is 'day',
+    'week', 'raw' (individual records) or 'auto' (day up to 90 days, else
+    week). Values are per-period means with min/max alongside.
+    """
+    range_name = request.args.get('range', '30d')
+    resolution = request.args.get('resolution', 'auto')
+    if range_name not in TREND_RANGES or resolution not in ('auto', 'raw', 'day', 'week'):
+        return jsonify({'error': 'Invalid range or resolution'}), 400
+    
+    days = TREND_RANGES[range_name]
+    since = datetime.utcnow() - timedelta(days=days)
+    if resolution == 'auto':
+        resolution = 'day' if days <= 90 else 'week'
+    
+    if resolution == 'raw':
+        records = HealthRecord.query.filter(
+            HealthRecord.user_id == current_user.id,
+            HealthRecord.recorded_at >= since
+        ).order_by(HealthRecord.recorded_at).all()
+        archived = archive.vitals_since(current_user.id, since)
+        if archived:
+            records = sorted(archived + records, key=lambda r: r.recorded_at)
+        
+        data = {
+            'dates': [r.recorded_at.strftime('%Y-%m-%d') for r in records],
+            'systolic_bp': [r.systolic_bp for r in records],
+            'diastolic_bp': [r.diastolic_bp for r in records],
+            'heart_rate': [r.heart_rate for r in records],
+            'blood_sugar': [r.blood_sugar for r in records]
+        }
+    else:
+        rollups = HealthRollup.query.filter(
+            HealthRollup.user_id == current_user.id,
+            HealthRollup.period == resolution,
+            HealthRollup.period_start >= period_start(since, resolution)
+        ).order_by(HealthRollup.period_start).all()
+        
+        data = {
+            'dates': [r.period_start.strftime('%Y-%m-%d') for r in rollups],
+            'count': [r.count for r in rollups]
+        }
+        for metric in HealthRollup.METRICS:
+            data[metric] = [r.mean(metric) for r in rollups]
+            data[f'{metric}_min'] = [getattr(r, f'{metric}_min') for r in rollups]
+            data[f'{metric}_max'] = [getattr(r, f'{metric}_max') for r in rollups]
     
+    data['range'] = range_name
+    data['resolution'] = resolution
     return jsonify(data)
 
-@app.route('/admin')
+def read_batch_rows():
+    """Read uploaded rows from a JSON body, CSV body or CSV file upload"""
+    if request.is_json:
+        payload = request.get_json()
+        rows = payload.get('records', []) if isinstance(payload, dict) else payload
+        if not isinstance(rows, list):
+            raise ValueError('Expected a list of records')
+        return rows
+    
+    upload = request.files.get('file')
+    text = upload.read().decode('utf-8-sig') if upload else request.get_data(as_text=True)
+    return list(csv.DictReader(io.StringIO(text)))
+
+@main.route('/api/predictions/batch', methods=['POST'])
+@login_required
+def predict_batch():
+    try:
+        rows = read_batch_rows()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not rows:
+        return jsonify({'error': 'No records supplied'}), 400
+    
+    # Admins may upload readings on behalf of residents
+    users = {current_user.id: current_user}
+    entries = []
+    errors = []
+    for index, row in enumerate(rows):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError('Each record must be an object')
+            user_id = int(row.get('user_id') or current_user.id)
+            if user_id != current_user.id and not current_user.is_admin:
+                raise ValueError('Not allowed to submit records for other users')
+            if user_id not in users:
+                users[user_id] = User.query.get(user_id)
+                if users[user_id] is None:
+                    raise ValueError(f'Unknown user {user_id}')
+            age = int(row['age']) if row.get('age') not in (None, '') else users[user_id].age
+            entries.append((user_id, parse_health_data(row, age)))
+        except (KeyError, TypeError, ValueError) as e:
+            errors.append({'row': index, 'error': str(e)})
+    
+    if errors:
+        return jsonify({'error': 'Invalid records', 'details': errors}), 400
+    
+    try:
+        # Insert all health records first so their IDs are known
+        health_records = [build_health_record(user_id, data) for user_id, data in entries]
+        for record, anomalies in zip(health_records, update_baselines(health_records)):
+            record.anomalies = format_anomalies(anomalies)
+        db.session.add_all(health_records)
+        db.session.flush()
+        update_rollups(health_records)
+        bump_data_version(user_id for user_id, _ in entries)
+        
+        model = health_predictor.ensure_loaded()
+        results = analyze_health_batch([data for _, data in entries], model)
+        
+        predictions = []
+        response = []
+        for (user_id, data), record, result in zip(entries, health_records, results):
+            risk_level, confidence, recommendations, predicted_conditions = result
+            predictions.append(Prediction(
+                user_id=user_id,
+                health_record_id=record.id,
+                risk_level=risk_level,
+                predicted_conditions=', '.join(predicted_conditions),
+                confidence_score=confidence,
+                recommendations='; '.join(recommendations),
+                model_version=model.version
+            ))
+            response.append({
+                'health_record_id': record.id,
+                'user_id': user_id,
+                'risk_level': risk_level,
+                'confidence': confidence,
+                'predicted_conditions': predicted_conditions,
+                'recommendations': recommendations,
+                'anomalies': [{'metric': label, 'z_score': z}
+                              for label, z in parse_anomalies(record.anomalies)]
+            })
+        
+        db.session.add_all(predictions)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Error processing health data: {str(e)}'}), 500
+    
+    return jsonify({'count': len(response), 'results': response})
+
+@main.route('/api/admin/import', methods=['POST'])
+@login_required
+def admin_import():
+    """Stream-import a CSV/JSONL upload (field `file`) or request body"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+    
+    upload = request.files.get('file')
+    fmt = request.args.get('format') or (format_for(upload.filename) if upload
+                                         else 'jsonl' if 'json' in (request.mimetype or '') else 'csv')
+    if fmt not in FORMATS:
+        return jsonify({'error': f'Unsupported format {fmt}'}), 400
+    
+    stream = io.TextIOWrapper(upload.stream if upload else request.stream, encoding='utf-8-sig',
+                              newline='')
+    result = import_records(iter_rows(stream, fmt),
+                            default_user_id=request.args.get('user_id', type=int),
+                            predict=request.args.get('predict') == '1')
+    return jsonify(result)
+
+@main.route('/api/admin/export')
+@login_required
+def admin_export():
+    """Stream all records (or ?user_id=) with predictions as CSV or JSONL"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({'error': f'Unsupported format {fmt}'}), 400
+    
+    user_id = request.args.get('user_id', type=int)
+    filename = f"health_records{f'_user{user_id}' if user_id else ''}.{fmt}"
+    return Response(
+        stream_with_context(export_records(user_id, fmt)),
+        mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@main.route('/api/admin/cache-stats')
+@login_required
+def cache_stats():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+    
+    return jsonify({
+        'prediction_cache': prediction_cache.stats(),
+        'response_cache': response_cache.stats(),
+        'prediction_worker': prediction_worker.stats()
+            if current_app.config['PREDICTION_MODE'] == 'async' else None,
+        'password_hasher': password_hasher.stats(),
+        'model_fingerprint': health_predictor.model_fingerprint,
+        'model_version': health_predictor.model_version
+    })
+
+@main.route('/api/admin/model-versions', methods=['GET', 'POST'])
+@login_required
+def model_versions():
+    """List published model versions, or make one current (all workers
+    switch to it in the background within HEALTH_MODEL_RELOAD_CHECK_SECONDS)"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+    
+    if request.method == 'POST':
+        version = (request.get_json(silent=True) or {}).get('version')
+        try:
+            model_registry.set_current(str(version))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'current': model_registry.current_version(),
+        'loaded': health_predictor.model_version,
+        'versions': [{name: value for name, value in metadata.items()
+                      if name not in ('checksums', 'manifest')}
+                     for metadata in model_registry.list_versions()]
+    })
+
+@main.route('/api/admin/profiling', methods=['GET', 'POST'])
+@login_required
+def profiling():
+    """Read or set the sampled profiler's rate for this worker process"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            rate = float(data['sample_rate'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'sample_rate must be a number between 0 and 1'}), 400
+        if not 0 <= rate <= 1:
+            return jsonify({'error': 'sample_rate must be a number between 0 and 1'}), 400
+        current_app.config['PROFILE_SAMPLE_RATE'] = rate
+    return jsonify({
+        'sample_rate': current_app.config['PROFILE_SAMPLE_RATE'],
+        'profile_dir': current_app.config['PROFILE_DIR']
+    })
+
+@main.route('/admin')
 @login_required
 def admin():
     if not current_user.is_admin:
         flash('Access denied. Admin privileges required.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
+    
+    search = request.args.get('q', '').strip()
+    users = admin_user_page(search, ADMIN_USERS_PER_PAGE)
+    total_users = User.query.count()
+    admin_count = User.query.filter_by(is_admin=True).count()
+    archived = archive.totals()
+    total_records = HealthRecord.query.count() + archived['records']
+    total_predictions = Prediction.query.count() + archived['predictions']
     
-    users = User.query.all()
-    total_records = HealthRecord.query.count()
-    total_predictions = Prediction.query.count()
+    # One grouped COUNT for the users on this page
+    record_counts = record_counts_for([user.id for user in users.items])
     
     return render_template('admin.html', 
                          users=users, 
+                         search=search,
+                         total_users=total_users,
+                         admin_count=admin_count,
                          total_records=total_records,
-                         total_predictions=total_predictions)
+                         total_predictions=total_predictions,
+                         record_counts=record_counts)
 
-@app.route('/admin/user/<int:user_id>')
+@main.route('/api/admin/users')
+@login_required
+def admin_users_api():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+    
+    page = admin_user_page(request.args.get('q', '').strip(), page_size(ADMIN_USERS_PER_PAGE))
+    record_counts = record_counts_for([user.id for user in page.items])
+    return jsonify({
+        'users': [serialize_user(user, record_counts.get(user.id, 0)) for user in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor
+    })
+
+@main.route('/admin/user/<int:user_id>')
 @login_required
 def admin_user_detail(user_id):
     if not current_user.is_admin:
         flash('Access denied.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     
     user = User.query.get_or_404(user_id)
-    health_records = HealthRecord.query.filter_by(user_id=user_id)\
-        .order_by(HealthRecord.recorded_at.desc())\
-        .limit(10).all()
+    health_records = keyset_paginate(
+        HealthRecord.query.filter_by(user_id=user_id).options(selectinload(HealthRecord.prediction)),
+        [HealthRecord.recorded_at, HealthRecord.id], 10,
+        extra=lambda values, greater, limit: archive.page(user_id, values, greater, limit)
+    ).items
+    record_count = record_counts_for([user_id]).get(user_id, 0)
     
-    return render_template('admin_user_detail.html', user=user, health_records=health_records)
+    return render_template('admin_user_detail.html', user=user, health_records=health_records,
+                           record_count=record_count, risk_counts=risk_counts_for(user_id))
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
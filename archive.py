@@ -0,0 +1,355 @@
+"""Columnar archive of old health records.
+
+`flask archive-records` moves health records older than ARCHIVE_AFTER_DAYS
+(whole months at a time), with their predictions, out of the database
+into compact per-user column files under ARCHIVE_DIR:
+
+    instance/archive/
+        totals.json     archived record and prediction counts, highest id
+        42.npy          float64 array with one row per name in COLUMNS
+        42.jsonl        free text of each record, one JSON array per line
+
+Each column is one contiguous row of the .npy file, which is opened
+memory-mapped, so a scan of a vital reads only that vital and not the wide
+free-text columns, which are read line by line (via the text_offset
+column) only when records are displayed. Records are sorted by recorded_at,
+so date ranges and cursors are found by binary search. Months are not
+split into files of their own: a resident has a few readings a month, and
+thousands of tiny files would take more disk blocks and file opens than
+the rows themselves.
+
+History, trends, exports and record counts read the archive alongside the
+live tables; trend rollups and baselines are kept for archived readings.
+The archive has a single writer (the CLI command): text is appended
+before the .npy file that points at it is replaced with os.replace(), so
+readers only ever see complete files.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from itertools import islice
+from types import SimpleNamespace
+import numpy as np
+from flask import current_app
+from models import db, HealthRecord, Prediction, VITAL_FIELDS, TEXT_FIELDS, bump_data_version
+
+# Rows of each .npy file; timestamps are microseconds since the epoch,
+# risk_level is an index into RISK_LEVELS and text_offset the position of
+# the record's line in the .jsonl file. Missing values are NaN.
+COLUMNS = ('id', 'recorded_at') + tuple(VITAL_FIELDS) + \
+    ('risk_level', 'confidence_score', 'predicted_at', 'text_offset')
+ROW = {name: index for index, name in enumerate(COLUMNS)}
+RISK_LEVELS = ('low', 'medium', 'high')
+
+# Per-record values kept in the .jsonl files, in this order
+TEXT_COLUMNS = TEXT_FIELDS + ['anomalies']
+PREDICTION_TEXT_COLUMNS = ['risk_level', 'predicted_conditions', 'recommendations',
+                           'model_version']
+TEXT_LINE = TEXT_COLUMNS + PREDICTION_TEXT_COLUMNS
+
+TOTALS_FILE = 'totals.json'
+EPOCH = datetime(1970, 1, 1)
+
+
+def archive_root():
+    return current_app.config['ARCHIVE_DIR']
+
+
+def _micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _datetime(micros):
+    return EPOCH + timedelta(microseconds=int(micros))
+
+
+def _path(user_id, extension, root):
+    return os.path.join(root or archive_root(), f'{user_id}.{extension}')
+
+
+def archived_users(root=None):
+    root = root or archive_root()
+    if not os.path.isdir(root):
+        return []
+    return sorted(int(name[:-4]) for name in os.listdir(root)
+                  if name.endswith('.npy') and name[:-4].isdigit())
+
+
+def totals(root=None):
+    """Number of archived records and predictions, and the highest
+    archived record id"""
+    try:
+        with open(os.path.join(root or archive_root(), TOTALS_FILE)) as f:
+            summary = json.load(f)
+    except FileNotFoundError:
+        summary = {'records': 0, 'predictions': 0}
+    if 'max_id' not in summary:
+        # Archives written before the id was kept
+        columns = (load_columns(user_id, root) for user_id in archived_users(root))
+        summary['max_id'] = max((int(np.max(rows[ROW['id']])) for rows in columns if rows.shape[1]),
+                                default=0)
+    return summary
+
+
+def reserve_ids(root=None):
+    """Make SQLite number new health records above every archived id.
+
+    AUTOINCREMENT keeps the ids of deleted rows from being reused, but a
+    table rebuilt by migrate_schema after its newest rows were archived
+    starts counting from the highest live id. No-op on other databases,
+    whose sequences never go back.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return
+    max_id = totals(root)['max_id']
+    if not max_id:
+        return
+    name = HealthRecord.__tablename__
+    db.session.execute(db.text('INSERT INTO sqlite_sequence (name, seq) SELECT :name, 0 '
+                               'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)'),
+                       {'name': name})
+    db.session.execute(db.text('UPDATE sqlite_sequence SET seq = :seq '
+                               'WHERE name = :name AND seq < :seq'),
+                       {'name': name, 'seq': max_id})
+    db.session.commit()
+
+
+def load_columns(user_id, root=None):
+    """Memory-mapped column array of a user's archived records, or None"""
+    try:
+        return np.load(_path(user_id, 'npy', root), mmap_mode='r')
+    except FileNotFoundError:
+        return None
+
+
+def record_counts(user_ids, root=None):
+    """Archived record count per user, for users that have any"""
+    counts = {}
+    for user_id in user_ids:
+        columns = load_columns(user_id, root)
+        if columns is not None:
+            counts[user_id] = columns.shape[1]
+    return counts
+
+
+def _value(column, value):
+    if np.isnan(value):
+        return None
+    if column in ('recorded_at', 'predicted_at'):
+        return _datetime(value)
+    if column in ('id', 'risk_level', 'text_offset'):
+        return int(value)
+    return VITAL_FIELDS.get(column, float)(value)
+
+
+def _records(user_id, columns, positions, root, with_text=True):
+    """HealthRecord-like objects (with a `prediction` list) for the given
+    positions of a user's columns"""
+    positions = np.asarray(positions, dtype=int)
+    if not len(positions):
+        return []
+    block = np.asarray(columns[:, positions])
+    texts = []
+    if with_text:
+        with open(_path(user_id, 'jsonl', root), 'rb') as f:
+            for offset in block[ROW['text_offset']]:
+                f.seek(int(offset))
+                texts.append(dict(zip(TEXT_LINE, json.loads(f.readline()))))
+
+    records = []
+    for position in range(block.shape[1]):
+        values = {name: _value(name, block[ROW[name], position]) for name in COLUMNS}
+        text = texts[position] if with_text else {}
+        record = SimpleNamespace(user_id=user_id, **{name: values[name] for name in
+                                                     ('id', 'recorded_at') + tuple(VITAL_FIELDS)})
+        for name in TEXT_COLUMNS:
+            setattr(record, name, text.get(name))
+        record.prediction = []
+        if values['predicted_at'] is not None:
+            record.prediction.append(SimpleNamespace(
+                health_record_id=record.id,
+                confidence_score=values['confidence_score'],
+                predicted_at=values['predicted_at'],
+                **{name: text.get(name) for name in PREDICTION_TEXT_COLUMNS}
+            ))
+        records.append(record)
+    return records
+
+
+def page(user_id, values=None, greater=False, limit=20, root=None):
+    """Up to `limit` archived records of a user past a (recorded_at, id)
+    cursor, for keyset_paginate(extra=...): newer ones in ascending order
+    if `greater`, else older ones newest first"""
+    columns = load_columns(user_id, root)
+    if columns is None:
+        return []
+    count = columns.shape[1]
+    if values is None:
+        positions = np.arange(count) if greater else np.arange(count)[::-1]
+    else:
+        times, ids = columns[ROW['recorded_at']], columns[ROW['id']]
+        cursor_time = _micros(values[0])
+        start = int(np.searchsorted(times, cursor_time, 'left'))
+        stop = int(np.searchsorted(times, cursor_time, 'right'))
+        tied = ids[start:stop]
+        if greater:
+            positions = np.concatenate([start + np.flatnonzero(tied > values[1]),
+                                        np.arange(stop, count)])
+        else:
+            positions = np.concatenate([np.arange(start),
+                                        start + np.flatnonzero(tied < values[1])])[::-1]
+    return _records(user_id, columns, positions[:limit], root)
+
+
+def vitals_since(user_id, since, root=None):
+    """A user's archived readings recorded at or after `since`, oldest
+    first, without their text"""
+    columns = load_columns(user_id, root)
+    if columns is None:
+        return []
+    start = int(np.searchsorted(columns[ROW['recorded_at']], _micros(since)))
+    return _records(user_id, columns, range(start, columns.shape[1]), root, with_text=False)
+
+
+def risk_counts(user_id, root=None):
+    """Archived predictions per risk level for a user"""
+    columns = load_columns(user_id, root)
+    if columns is None:
+        return {}
+    levels = np.asarray(columns[ROW['risk_level']])
+    codes, counts = np.unique(levels[~np.isnan(levels)].astype(int), return_counts=True)
+    return {RISK_LEVELS[code]: int(count) for code, count in zip(codes, counts)}
+
+
+def iter_archived(user_id=None, root=None, chunk_size=5000):
+    """Every archived record (of one user, or all), by user and date"""
+    for user in ([user_id] if user_id is not None else archived_users(root)):
+        columns = load_columns(user, root)
+        if columns is None:
+            continue
+        for start in range(0, columns.shape[1], chunk_size):
+            yield from _records(user, columns, range(start, min(start + chunk_size,
+                                                                columns.shape[1])), root)
+
+
+def iter_chunks(records, chunk_size):
+    """Lists of up to chunk_size items from an iterable"""
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def archive_cutoff(after_days):
+    """Start of the month containing the day `after_days` ago, so that only
+    whole months are archived"""
+    day = datetime.utcnow() - timedelta(days=after_days)
+    return datetime(day.year, day.month, 1)
+
+
+def _append(user_id, rows, texts, root):
+    """Add records (an array shaped like COLUMNS x n, and their text) to a
+    user's files, replacing archived copies of the same record (same id
+    and recorded_at)"""
+    path = _path(user_id, 'jsonl', root)
+    with open(path, 'ab') as f:
+        offset = f.tell()
+        for position, text in enumerate(texts):
+            line = (json.dumps(text) + '\n').encode()
+            rows[ROW['text_offset'], position] = offset
+            f.write(line)
+            offset += len(line)
+
+    existing = load_columns(user_id, root)
+    if existing is not None:
+        rows = np.concatenate([np.asarray(existing), rows], axis=1)
+        # Keep the last copy of each record, e.g. after an interrupted run.
+        # An id alone is not enough: databases from before AUTOINCREMENT
+        # may have reused the ids of archived records
+        keys = rows[[ROW['id'], ROW['recorded_at']]].T[::-1]
+        _, last = np.unique(keys, axis=0, return_index=True)
+        rows = rows[:, rows.shape[1] - 1 - last]
+    rows = rows[:, np.lexsort((rows[ROW['id']], rows[ROW['recorded_at']]))]
+
+    path = _path(user_id, 'npy', root)
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, np.ascontiguousarray(rows))
+    os.replace(path + '.tmp', path)
+    return rows
+
+
+def archive_records(before, root=None, chunk_size=1000):
+    """Move health records recorded before `before`, and their
+    predictions, into the archive, one user at a time.
+
+    A user's files are written before their rows are deleted and the
+    deletion committed, so an interrupted run loses nothing and the next
+    run replaces the duplicates. Returns the number of records archived.
+    """
+    root = root or archive_root()
+    os.makedirs(root, exist_ok=True)
+    reserve_ids(root)
+    user_ids = [user_id for (user_id,) in db.session.query(HealthRecord.user_id)
+                .filter(HealthRecord.recorded_at < before).distinct().order_by(HealthRecord.user_id)]
+    record_columns = [getattr(HealthRecord, name) for name in
+                      ['id', 'recorded_at'] + list(VITAL_FIELDS) + TEXT_COLUMNS]
+    prediction_columns = [Prediction.id.label('prediction_id'), Prediction.confidence_score,
+                          Prediction.predicted_at] + \
+        [getattr(Prediction, name) for name in PREDICTION_TEXT_COLUMNS]
+
+    summary = totals(root)
+    archived = 0
+    for user_id in user_ids:
+        rows = db.session.query(*record_columns, *prediction_columns)\
+            .outerjoin(Prediction, Prediction.health_record_id == HealthRecord.id)\
+            .filter(HealthRecord.user_id == user_id, HealthRecord.recorded_at < before)\
+            .order_by(HealthRecord.id, Prediction.predicted_at).all()
+        # The latest prediction of each record is archived with it
+        latest = list({row.id: row for row in rows}.values())
+
+        values = np.full((len(COLUMNS), len(latest)), np.nan)
+        texts = []
+        for position, row in enumerate(latest):
+            values[ROW['id'], position] = row.id
+            values[ROW['recorded_at'], position] = _micros(row.recorded_at)
+            for name in VITAL_FIELDS:
+                if getattr(row, name) is not None:
+                    values[ROW[name], position] = getattr(row, name)
+            if row.prediction_id is not None:
+                if row.risk_level in RISK_LEVELS:
+                    values[ROW['risk_level'], position] = RISK_LEVELS.index(row.risk_level)
+                if row.confidence_score is not None:
+                    values[ROW['confidence_score'], position] = row.confidence_score
+                if row.predicted_at is not None:
+                    values[ROW['predicted_at'], position] = _micros(row.predicted_at)
+            texts.append([getattr(row, name) for name in TEXT_LINE])
+
+        previous = load_columns(user_id, root)
+        previous = _counts(previous) if previous is not None else (0, 0)
+        current = _counts(_append(user_id, values, texts, root))
+
+        ids = [row.id for row in latest]
+        for chunk in iter_chunks(ids, chunk_size):
+            db.session.query(Prediction).filter(Prediction.health_record_id.in_(chunk))\
+                .delete(synchronize_session=False)
+            db.session.query(HealthRecord).filter(HealthRecord.id.in_(chunk))\
+                .delete(synchronize_session=False)
+        bump_data_version([user_id])
+        db.session.commit()
+
+        summary['records'] += current[0] - previous[0]
+        summary['predictions'] += current[1] - previous[1]
+        summary['max_id'] = max([summary['max_id']] + ids)
+        staging = os.path.join(root, TOTALS_FILE + '.tmp')
+        with open(staging, 'w') as f:
+            json.dump(summary, f)
+        os.replace(staging, os.path.join(root, TOTALS_FILE))
+        archived += len(ids)
+    return archived
+
+
+def _counts(columns):
+    """(records, predictions) in a user's column array"""
+    return columns.shape[1], int(np.count_nonzero(~np.isnan(columns[ROW['predicted_at']])))
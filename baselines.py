@@ -0,0 +1,220 @@
+"""Streaming per-user baselines of each vital and anomaly flags.
+
+Every user has one HealthBaseline row holding, per vital, the running mean
+and sum of squared deviations (Welford's algorithm) and an exponentially
+weighted recent average. Adding a reading updates them in O(1), so a
+submission is compared with the resident's own history without rescanning
+it: a value more than ANOMALY_Z standard deviations from the user's mean
+is flagged once the baseline has MIN_READINGS readings. The gap between
+the recent average and the long-run mean is the trajectory shown on the
+dashboard.
+"""
+import math
+import os
+from datetime import datetime
+from models import db, HealthRecord, HealthBaseline
+from database import upsert_insert
+import archive
+
+ANOMALY_Z = float(os.environ.get('ANOMALY_Z_THRESHOLD', '3.0'))
+MIN_READINGS = int(os.environ.get('ANOMALY_MIN_READINGS', '5'))
+
+# Weight of the newest reading in the recent average
+RECENT_ALPHA = 0.3
+
+# Smallest standard deviation used for z-scores, so a resident whose
+# readings barely varied is not flagged for an ordinary fluctuation
+MIN_STD = {
+    'weight': 1.0,
+    'systolic_bp': 5.0,
+    'diastolic_bp': 4.0,
+    'heart_rate': 5.0,
+    'blood_sugar': 10.0,
+    'cholesterol': 10.0,
+    'sleep_hours': 0.5
+}
+
+METRIC_LABELS = {
+    'weight': 'Weight',
+    'systolic_bp': 'Systolic BP',
+    'diastolic_bp': 'Diastolic BP',
+    'heart_rate': 'Heart rate',
+    'blood_sugar': 'Blood sugar',
+    'cholesterol': 'Cholesterol',
+    'sleep_hours': 'Sleep'
+}
+
+
+def _empty_state():
+    state = {'count': 0}
+    for metric in HealthBaseline.METRICS:
+        state.update({f'{metric}_mean': 0.0, f'{metric}_m2': 0.0, f'{metric}_recent': None})
+    return state
+
+
+def _std(state, metric):
+    """Sample standard deviation, floored at MIN_STD"""
+    m2 = state[f'{metric}_m2'] or 0.0
+    variance = m2 / (state['count'] - 1) if state['count'] > 1 else 0.0
+    return max(math.sqrt(variance), MIN_STD[metric])
+
+
+def _add(state, record):
+    """Score one reading against state, then fold it in; returns {metric: z}
+    for the readings that deviate by at least ANOMALY_Z.
+
+    A metric whose stored mean or sum of squares is missing (NULL, e.g. a
+    NaN that SQLite stored as NULL) starts again from this reading instead
+    of failing every later update."""
+    anomalies = {}
+    count = state['count'] + 1
+    for metric in HealthBaseline.METRICS:
+        value = getattr(record, metric)
+        if value is None or not math.isfinite(float(value)):
+            continue
+        value = float(value)
+        mean = state[f'{metric}_mean']
+        if mean is None or state[f'{metric}_m2'] is None:
+            state[f'{metric}_mean'] = value
+            state[f'{metric}_m2'] = 0.0
+            state[f'{metric}_recent'] = value
+            continue
+        if state['count'] >= MIN_READINGS:
+            z = (value - mean) / _std(state, metric)
+            if abs(z) >= ANOMALY_Z:
+                anomalies[metric] = z
+        delta = value - mean
+        mean += delta / count
+        state[f'{metric}_mean'] = mean
+        state[f'{metric}_m2'] += delta * (value - mean)
+        recent = state[f'{metric}_recent']
+        state[f'{metric}_recent'] = value if recent is None \
+            else recent + RECENT_ALPHA * (value - recent)
+    state['count'] = count
+    return anomalies
+
+
+def format_anomalies(anomalies):
+    """Store {metric: z} as 'metric=z,...' in HealthRecord.anomalies"""
+    return ','.join(f'{metric}={z:+.1f}' for metric, z in anomalies.items()) or None
+
+
+def parse_anomalies(text):
+    """(label, z) pairs from HealthRecord.anomalies"""
+    pairs = []
+    for item in (text or '').split(','):
+        metric, _, z = item.partition('=')
+        if metric in METRIC_LABELS:
+            pairs.append((METRIC_LABELS[metric], float(z)))
+    return pairs
+
+
+def update_baselines(records):
+    """Fold new health records into their users' baselines.
+
+    Call before the records are written, in the same transaction, with
+    objects that have user_id, recorded_at and the metric attributes.
+    Readings are added in recorded_at order. Returns the anomalies of each
+    record as {metric: z}, in input order.
+    """
+    if not records:
+        return []
+    user_ids = sorted({record.user_id for record in records})
+    # Create missing rows first (a no-op for existing ones), then read the
+    # rows locked: with FOR UPDATE on server databases and, on SQLite, under
+    # the write lock the INSERT took, so concurrent submissions for one user
+    # are applied one after the other instead of overwriting each other
+    db.session.execute(
+        upsert_insert(db.session.get_bind().dialect, HealthBaseline.__table__)
+        .on_conflict_do_nothing(index_elements=['user_id']),
+        [{'user_id': user_id, 'updated_at': datetime.utcnow(), **_empty_state()}
+         for user_id in user_ids]
+    )
+    rows = db.session.execute(
+        db.select(HealthBaseline).where(HealthBaseline.user_id.in_(user_ids))
+        .with_for_update().execution_options(populate_existing=True)
+    ).scalars()
+    existing = {row.user_id: row for row in rows}
+    states = {user_id: {column: getattr(existing[user_id], column) for column in _empty_state()}
+              for user_id in user_ids}
+
+    anomalies = [None] * len(records)
+    order = sorted(range(len(records)), key=lambda i: records[i].recorded_at or datetime.utcnow())
+    for i in order:
+        anomalies[i] = _add(states[records[i].user_id], records[i])
+
+    now = datetime.utcnow()
+    for user_id, state in states.items():
+        row = existing[user_id]
+        for column, value in state.items():
+            setattr(row, column, value)
+        row.updated_at = now
+    return anomalies
+
+
+def trajectory(baseline):
+    """Per-metric baseline summary for the dashboard: long-run mean and
+    spread, recent average and whether it is rising, falling or stable"""
+    if baseline is None or baseline.count < 2:
+        return []
+    state = {column: getattr(baseline, column) for column in _empty_state()}
+    rows = []
+    for metric in HealthBaseline.METRICS:
+        mean = state[f'{metric}_mean']
+        if mean is None:
+            continue
+        std = _std(state, metric)
+        recent = state[f'{metric}_recent']
+        shift = (recent - mean) / std if recent is not None else 0.0
+        rows.append({
+            'metric': metric,
+            'label': METRIC_LABELS[metric],
+            'mean': mean,
+            'std': std,
+            'recent': recent,
+            'direction': 'rising' if shift >= 1 else 'falling' if shift <= -1 else 'stable'
+        })
+    return rows
+
+
+def rebuild_baselines(user_id=None, chunk_size=5000):
+    """Recompute baselines from the raw health records, archived ones
+    first, oldest first; returns records folded in. Stored anomaly flags
+    are left as they are."""
+    baselines = HealthBaseline.query
+    columns = [HealthRecord.user_id, HealthRecord.recorded_at] + \
+        [getattr(HealthRecord, metric) for metric in HealthBaseline.METRICS]
+    query = db.select(*columns)
+    if user_id is not None:
+        baselines = baselines.filter_by(user_id=user_id)
+        query = query.where(HealthRecord.user_id == user_id)
+    baselines.delete(synchronize_session=False)
+
+    rows = db.session.execute(
+        query.order_by(HealthRecord.user_id, HealthRecord.recorded_at, HealthRecord.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    states = {}
+    total = 0
+    for record in archive.iter_archived(user_id):
+        state = states.get(record.user_id)
+        if state is None:
+            state = states[record.user_id] = _empty_state()
+        _add(state, record)
+        total += 1
+    for row in rows:
+        state = states.get(row.user_id)
+        if state is None:
+            state = states[row.user_id] = _empty_state()
+        _add(state, row)
+        total += 1
+
+    now = datetime.utcnow()
+    users = list(states.items())
+    for start in range(0, len(users), chunk_size):
+        db.session.execute(db.insert(HealthBaseline), [
+            {'user_id': user, 'updated_at': now, **state}
+            for user, state in users[start:start + chunk_size]
+        ])
+    db.session.commit()
+    return total
@@ -0,0 +1,198 @@
+"""Storage size and scan speed of the columnar archive versus the live table.
+
+Seeds --records readings over two years for --users residents (with
+typical free text in symptoms, medication and allergies), then measures
+with everything in health_record and again after `archive_records` has
+moved all of it into the archive:
+
+- bytes on disk: the VACUUMed database versus the archive's .npy (numeric
+  columns) and .jsonl (free text) files
+- a scan of one vital for every resident (analytics over the whole table)
+- a scan of one resident's full history of four vitals
+- /history and /api/health-trends?resolution=raw latency
+
+    python benchmarks/archive_scan.py
+    python benchmarks/archive_scan.py --users 2000 --records 500000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from common import make_app, seed, login_as, time_call
+
+SYMPTOMS = ['', 'Headache', 'Fatigue, Dizziness', 'Shortness of breath, Chest pain',
+            'Joint pain, Swelling in ankles']
+MEDICATION = ['', 'Lisinopril 10mg once daily', 'Metformin 500mg twice daily with meals',
+              'Atorvastatin 20mg at night; Aspirin 75mg daily']
+ALLERGIES = ['', 'None known', 'Penicillin', 'Shellfish, Latex']
+SCAN_METRICS = ['systolic_bp', 'diastolic_bp', 'heart_rate', 'blood_sugar']
+
+
+def add_text(app):
+    """Fill the free-text columns the way real submissions do"""
+    from models import db, HealthRecord
+
+    rng = random.Random(3)
+    with app.app_context():
+        ids = [record_id for (record_id,) in db.session.query(HealthRecord.id)]
+        for start in range(0, len(ids), 50000):
+            db.session.execute(db.update(HealthRecord), [
+                {'id': record_id, 'symptoms': rng.choice(SYMPTOMS),
+                 'medication': rng.choice(MEDICATION), 'allergies': rng.choice(ALLERGIES),
+                 'exercise_frequency': rng.choice(['daily', 'weekly', 'rarely'])}
+                for record_id in ids[start:start + 50000]
+            ])
+        db.session.commit()
+
+
+def database_bytes(app, db_path):
+    from models import db
+
+    with app.app_context():
+        db.session.remove()
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql('VACUUM')
+            connection.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+    return os.path.getsize(db_path)
+
+
+def archive_bytes(root):
+    apparent = allocated = files = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            stat = os.stat(os.path.join(directory, name))
+            apparent += stat.st_size
+            allocated += stat.st_blocks * 512
+            files += 1
+    return {'files': files, 'apparent_mb': round(apparent / 2**20, 2),
+            'allocated_mb': round(allocated / 2**20, 2)}
+
+
+def scan_table_all(app):
+    """Mean systolic BP per resident from health_record"""
+    from models import db, HealthRecord
+
+    with app.app_context():
+        rows = db.session.query(HealthRecord.user_id, HealthRecord.systolic_bp).all()
+    totals = {}
+    for user_id, value in rows:
+        total = totals.setdefault(user_id, [0.0, 0])
+        total[0] += value
+        total[1] += 1
+    return {user_id: total / count for user_id, (total, count) in totals.items()}
+
+
+def scan_archive_all(app):
+    """Mean systolic BP per resident from the archive"""
+    import archive
+
+    with app.app_context():
+        means = {}
+        for user_id in archive.archived_users():
+            means[user_id] = float(archive.load_columns(user_id)[archive.ROW['systolic_bp']].mean())
+    return means
+
+
+def scan_table_user(app, user_id):
+    from models import db, HealthRecord
+
+    with app.app_context():
+        columns = [HealthRecord.recorded_at] + [getattr(HealthRecord, name) for name in SCAN_METRICS]
+        return db.session.query(*columns).filter(HealthRecord.user_id == user_id)\
+            .order_by(HealthRecord.recorded_at).all()
+
+
+def scan_archive_user(app, user_id):
+    import archive
+
+    with app.app_context():
+        rows = [archive.ROW[name] for name in ['recorded_at'] + SCAN_METRICS]
+        return np.asarray(archive.load_columns(user_id)[rows])
+
+
+def measure(app, user_ids, samples, repeat):
+    client = app.test_client()
+    users = random.Random(2).sample(user_ids, min(samples, len(user_ids)))
+
+    def per_user(fn):
+        return round(statistics.median(time_call(lambda: fn(user_id), repeat)['median_ms']
+                                       for user_id in users), 3)
+
+    def route(path):
+        timings = []
+        for user_id in users:
+            login_as(client, user_id)
+            timings.append(time_call(lambda: client.get(path), repeat)['median_ms'])
+        return round(statistics.median(timings), 3)
+
+    return per_user, route
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--samples', type=int, default=10, help="residents timed per query")
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    import archive
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        root = os.path.join(tmp, 'archive')
+        app = make_app(db_path, ARCHIVE_DIR=root, RESPONSE_CACHE='none')
+        user_ids = seed(app, args.users, args.records)
+        add_text(app)
+
+        results = {'live': {}, 'archived': {}}
+        full_size = database_bytes(app, db_path)
+        per_user, route = measure(app, user_ids, args.samples, args.repeat)
+        results['live']['scan_all_users_ms'] = time_call(lambda: scan_table_all(app), 3)['median_ms']
+        results['live']['scan_one_user_ms'] = per_user(lambda user_id: scan_table_user(app, user_id))
+        results['live']['history_ms'] = route('/history')
+        results['live']['trends_raw_ms'] = route('/api/health-trends?range=5y&resolution=raw')
+        expected = scan_table_all(app)
+
+        with app.app_context():
+            # Everything recorded up to now, so the whole table is archived
+            start = datetime.utcnow()
+            archived = archive.archive_records(start + timedelta(seconds=1))
+            archive_s = (datetime.utcnow() - start).total_seconds()
+        empty_size = database_bytes(app, db_path)
+
+        per_user, route = measure(app, user_ids, args.samples, args.repeat)
+        results['archived']['scan_all_users_ms'] = \
+            time_call(lambda: scan_archive_all(app), 3)['median_ms']
+        results['archived']['scan_one_user_ms'] = \
+            per_user(lambda user_id: scan_archive_user(app, user_id))
+        results['archived']['history_ms'] = route('/history')
+        results['archived']['trends_raw_ms'] = route('/api/health-trends?range=5y&resolution=raw')
+        actual = scan_archive_all(app)
+        assert all(abs(actual[user_id] - mean) < 1e-6 for user_id, mean in expected.items())
+
+        storage = archive_bytes(root)
+        storage['table_mb'] = round((full_size - empty_size) / 2**20, 2)
+        numeric = sum(os.path.getsize(os.path.join(directory, name))
+                      for directory, _, names in os.walk(root)
+                      for name in names if name.endswith('.npy'))
+        storage['numeric_columns_mb'] = round(numeric / 2**20, 2)
+
+    print(json.dumps({
+        'users': args.users,
+        'records': args.records,
+        'archived': archived,
+        'archive_s': round(archive_s, 1),
+        'storage': storage,
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
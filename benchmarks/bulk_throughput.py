@@ -0,0 +1,105 @@
+"""Throughput of the streaming bulk import and export.
+
+Writes a synthetic CSV (default: 1M rows across 1k users), imports it
+without predictions, imports a smaller file with predictions, then exports
+everything as CSV, reporting rows per second and peak memory.
+
+    python benchmarks/bulk_throughput.py --rows 1000000 --predict-rows 100000
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import make_app, seed
+
+COLUMNS = ['user_id', 'recorded_at', 'weight', 'height', 'systolic_bp', 'diastolic_bp',
+           'heart_rate', 'blood_sugar', 'cholesterol', 'sleep_hours', 'exercise_frequency']
+
+
+def write_csv(path, rows, user_ids, seed=0):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for _ in range(rows):
+            writer.writerow([
+                rng.choice(user_ids),
+                (now - timedelta(seconds=rng.uniform(0, 5 * 365 * 86400))).isoformat(),
+                round(rng.uniform(50, 120), 1), round(rng.uniform(150, 190), 1),
+                rng.randint(100, 200), rng.randint(60, 120), rng.randint(50, 120),
+                round(rng.uniform(70, 300), 1), round(rng.uniform(150, 300), 1),
+                round(rng.uniform(4, 10), 1), rng.choice(['daily', 'weekly', 'rarely'])
+            ])
+
+
+def peak_rss_mb():
+    from ml_model import peak_rss_mb
+    return round(peak_rss_mb(), 1)
+
+
+def timed_import(app, path, predict):
+    from bulk_io import iter_rows, import_records
+
+    with app.app_context(), open(path, newline='') as f:
+        start = time.perf_counter()
+        result = import_records(iter_rows(f, 'csv'), predict=predict)
+        elapsed = time.perf_counter() - start
+    return {
+        'rows': result['imported'],
+        'failed': result['failed'],
+        'seconds': round(elapsed, 2),
+        'rows_per_s': round(result['imported'] / elapsed),
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--predict-rows', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args()
+
+    from bulk_io import export_records
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        user_ids = seed(app, args.users, 0)
+        results['baseline_rss_mb'] = peak_rss_mb()
+
+        plain = os.path.join(tmp, 'plain.csv')
+        write_csv(plain, args.rows, user_ids)
+        results['file_mb'] = round(os.path.getsize(plain) / 1e6, 1)
+        results['import'] = timed_import(app, plain, predict=False)
+
+        scored = os.path.join(tmp, 'scored.csv')
+        write_csv(scored, args.predict_rows, user_ids, seed=1)
+        results['import_with_predictions'] = timed_import(app, scored, predict=True)
+
+        with app.app_context():
+            start = time.perf_counter()
+            size = 0
+            for chunk in export_records():
+                size += len(chunk)
+            elapsed = time.perf_counter() - start
+        exported = args.rows + args.predict_rows
+        results['export_csv'] = {
+            'rows': exported,
+            'mb': round(size / 1e6, 1),
+            'seconds': round(elapsed, 2),
+            'rows_per_s': round(exported / elapsed),
+            'peak_rss_mb': peak_rss_mb()
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Shared helpers for the benchmark scripts: app setup, seeding and timing."""
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def make_app(db_path, **config):
+    """Create the app against a scratch SQLite file, with its record
+    archive next to it rather than in instance/"""
+    from app import create_app
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(db_path),
+        'ARCHIVE_DIR': os.path.join(os.path.dirname(os.path.abspath(db_path)), 'archive'),
+        'MODEL_WARMUP': 'lazy',
+    }
+    settings.update(config)
+    return create_app(settings)
+
+
+def seed(app, users, records, predictions=True, days=730, batch_size=50000, seed=0):
+    """Insert synthetic users, health records and predictions in bulk.
+
+    Records are spread uniformly over users and over the last `days` days.
+    All users share one password hash ('password') to keep seeding fast.
+    Returns the list of seeded user ids.
+    """
+    from werkzeug.security import generate_password_hash
+    from models import db, User, HealthRecord, Prediction
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    password_hash = generate_password_hash('password')
+    with app.app_context():
+        first_user = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+        db.session.execute(db.insert(User), [
+            {'username': f'bench{first_user + i}', 'email': f'bench{first_user + i}@example.com',
+             'password_hash': password_hash, 'age': rng.randint(60, 95),
+             'gender': rng.choice(['male', 'female']), 'is_admin': False, 'created_at': now}
+            for i in range(users)
+        ])
+        user_ids = list(range(first_user, first_user + users))
+        db.session.commit()
+        next_record = (db.session.query(db.func.max(HealthRecord.id)).scalar() or 0) + 1
+
+        for start in range(0, records, batch_size):
+            count = min(batch_size, records - start)
+            rows = []
+            for i in range(count):
+                rows.append({
+                    'id': next_record + start + i,
+                    'user_id': rng.choice(user_ids),
+                    'weight': rng.uniform(50, 120), 'height': rng.uniform(150, 190),
+                    'systolic_bp': rng.randint(100, 200), 'diastolic_bp': rng.randint(60, 120),
+                    'heart_rate': rng.randint(50, 120), 'blood_sugar': rng.uniform(70, 300),
+                    'cholesterol': rng.uniform(150, 300), 'sleep_hours': rng.uniform(4, 10),
+                    'symptoms': '', 'medication': '', 'allergies': '', 'exercise_frequency': '',
+                    'recorded_at': now - timedelta(seconds=rng.uniform(0, days * 86400)),
+                })
+            db.session.execute(db.insert(HealthRecord), rows)
+            if predictions:
+                db.session.execute(db.insert(Prediction), [
+                    {'user_id': row['user_id'], 'health_record_id': row['id'],
+                     'risk_level': rng.choice(['low', 'medium', 'high']),
+                     'predicted_conditions': 'Hypertension', 'confidence_score': rng.random(),
+                     'recommendations': 'Monitor blood pressure regularly',
+                     'predicted_at': row['recorded_at']}
+                    for row in rows
+                ])
+            db.session.commit()
+    return user_ids
+
+
+def login_as(client, user_id):
+    """Authenticate a test client without hashing a password"""
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+
+def time_call(fn, repeat=20):
+    """Median and p95 wall time of fn() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+    }
+
+
+def history_page_path(client, page):
+    """/history?after=<cursor> for the logged-in user's `page`th history
+    page, found by following next_cursor through /api/history (which pages
+    the same way); the last page if there are fewer"""
+    path = '/history'
+    for _ in range(page - 1):
+        cursor = client.get('/api/history' + path[len('/history'):]).get_json()['next_cursor']
+        if cursor is None:
+            break
+        path = '/history?after=' + quote(cursor)
+    return path
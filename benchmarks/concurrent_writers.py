@@ -0,0 +1,141 @@
+"""Concurrent /input-health submissions against one SQLite database.
+
+Simulates --users residents spread over --workers processes (threads
+within each), all posting readings for --duration seconds and opening
+/history between submissions, and reports throughput, latency and how
+many submissions failed with "database is locked". Run it once with the
+defaults (WAL) and once with the old rollback-journal settings to compare:
+
+    python benchmarks/concurrent_writers.py --users 50 --workers 4
+    python benchmarks/concurrent_writers.py --journal-mode DELETE --synchronous FULL \\
+        --busy-timeout-ms 5000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+FORM = {
+    'weight': '72', 'height': '168', 'systolic_bp': '135', 'diastolic_bp': '85',
+    'heart_rate': '74', 'blood_sugar': '110', 'cholesterol': '195', 'sleep_hours': '7',
+    'exercise_frequency': 'weekly'
+}
+
+
+def post_readings(app, user_id, deadline, read_every, start_barrier, results):
+    from common import login_as
+
+    client = app.test_client()
+    login_as(client, user_id)
+    rng = random.Random(user_id)
+    ok = locked = failed = 0
+    latencies = []
+    start_barrier.wait()
+    while time.perf_counter() < deadline:
+        form = dict(FORM, systolic_bp=str(rng.randint(100, 180)))
+        start = time.perf_counter()
+        response = client.post('/input-health', data=form)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code == 302 and response.location.endswith('/analysis'):
+            ok += 1
+        elif b'database is locked' in response.data:
+            locked += 1
+        else:
+            failed += 1
+        if read_every and (ok + locked + failed) % read_every == 0:
+            client.get('/history')
+    results.append((ok, locked, failed, latencies))
+
+
+def worker(db_path, user_ids, duration, read_every, ready, start_event, queue):
+    from common import make_app
+    from ml_model import health_predictor
+
+    app = make_app(db_path, INIT_DB=False)
+    health_predictor.ensure_loaded()
+
+    results = []
+    barrier = threading.Barrier(len(user_ids) + 1)
+    ready.release()
+    start_event.wait()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=post_readings,
+                                args=(app, user_id, deadline, read_every, barrier, results))
+               for user_id in user_ids]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    queue.put(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=4, help="processes sharing the users")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds of load")
+    parser.add_argument('--read-every', type=int, default=1,
+                        help="load /history after every Nth submission (0: never)")
+    parser.add_argument('--journal-mode', default='WAL')
+    parser.add_argument('--synchronous', default='NORMAL')
+    parser.add_argument('--busy-timeout-ms', type=int, default=10000)
+    args = parser.parse_args()
+
+    # Read by database.py when the app is imported in the workers
+    os.environ['CARENEST_SQLITE_JOURNAL_MODE'] = args.journal_mode
+    os.environ['CARENEST_SQLITE_SYNCHRONOUS'] = args.synchronous
+    os.environ['CARENEST_SQLITE_BUSY_TIMEOUT_MS'] = str(args.busy_timeout_ms)
+
+    from common import make_app, seed
+
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        user_ids = seed(make_app(db_path), args.users, 0)
+
+        queue = context.Queue()
+        ready = context.Semaphore(0)
+        start_event = context.Event()
+        processes = [context.Process(target=worker, args=(
+                         db_path, user_ids[index::args.workers], args.duration,
+                         args.read_every, ready, start_event, queue))
+                     for index in range(args.workers)]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.acquire()
+        start_event.set()
+
+        results = []
+        for _ in processes:
+            results.extend(queue.get())
+        for process in processes:
+            process.join()
+
+    ok = sum(r[0] for r in results)
+    locked = sum(r[1] for r in results)
+    failed = sum(r[2] for r in results)
+    latencies = sorted(latency for r in results for latency in r[3])
+    print(json.dumps({
+        'users': args.users,
+        'workers': args.workers,
+        'journal_mode': args.journal_mode,
+        'synchronous': args.synchronous,
+        'busy_timeout_ms': args.busy_timeout_ms,
+        'submissions': ok,
+        'lock_errors': locked,
+        'other_errors': failed,
+        'throughput_per_s': round(ok / args.duration, 1),
+        'median_ms': round(statistics.median(latencies), 1) if latencies else None,
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)], 1) if latencies else None,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Per-route latency of the per-user timeline queries with and without indexes.
+
+Seeds a scratch SQLite database (default: 1M records across 10k users),
+times each route with the timeline indexes dropped, then recreates them
+through migrate_schema() and times again.
+
+    python benchmarks/db_queries.py --users 10000 --records 1000000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from common import make_app, seed, login_as, time_call, history_page_path
+
+INDEXES = ['ix_health_record_user_recorded', 'ix_prediction_user_predicted',
+           'uq_prediction_health_record']
+
+ROUTES = ['/dashboard', '/history', '/api/health-trends']
+# History page reached by following cursors, timed as its own route
+DEEP_HISTORY_PAGE = 3
+
+
+def measure_routes(app, user_ids, samples, repeat):
+    client = app.test_client()
+    rng = random.Random(1)
+    users = rng.sample(user_ids, min(samples, len(user_ids)))
+    routes = [(route, lambda route=route: route) for route in ROUTES] + \
+        [(f'/history (page {DEEP_HISTORY_PAGE})',
+          lambda: history_page_path(client, DEEP_HISTORY_PAGE))]
+    results = {}
+    for name, path_for_user in routes:
+        timings = []
+        for user_id in users:
+            login_as(client, user_id)
+            path = path_for_user()
+            timings.append(time_call(lambda: client.get(path), repeat)['median_ms'])
+        timings.sort()
+        results[name] = {'median_ms': timings[len(timings) // 2], 'max_ms': timings[-1]}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--samples', type=int, default=20, help="users timed per route")
+    parser.add_argument('--repeat', type=int, default=5, help="requests per user and route")
+    args = parser.parse_args()
+
+    from models import db, migrate_schema
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        start = time.perf_counter()
+        user_ids = seed(app, args.users, args.records)
+        seeded = time.perf_counter() - start
+
+        with app.app_context():
+            for name in INDEXES:
+                db.session.execute(db.text(f'DROP INDEX IF EXISTS {name}'))
+            db.session.commit()
+        before = measure_routes(app, user_ids, args.samples, args.repeat)
+
+        with app.app_context():
+            migrate_schema()
+        after = measure_routes(app, user_ids, args.samples, args.repeat)
+
+    print(json.dumps({
+        'users': args.users,
+        'records': args.records,
+        'seed_s': round(seeded, 1),
+        'without_indexes': before,
+        'with_indexes': after,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
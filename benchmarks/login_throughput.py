@@ -0,0 +1,139 @@
+"""Login throughput for each password hash setting.
+
+For every method in --methods, seeds --users accounts hashed with it and
+posts /login from --threads concurrent clients for --duration seconds,
+reporting logins per second overall and per core. A final run stores the
+hashes with the first method and serves logins configured with the last
+one, to show the one-off cost of rehash-on-login. The clients are threads
+in one process, i.e. one worker with --threads; sync workers scale with
+the number of processes instead.
+
+    python benchmarks/login_throughput.py
+    python benchmarks/login_throughput.py --methods scrypt,pbkdf2:sha256:600000 --threads 16
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from common import make_app
+
+DEFAULT_METHODS = 'scrypt:32768:8:1,scrypt:16384:8:1,pbkdf2:sha256:600000,pbkdf2:sha256:260000'
+
+
+def seed_users(app, count, method):
+    """Users with distinct passwords hashed with `method`"""
+    from werkzeug.security import generate_password_hash
+    from models import db, User
+
+    with app.app_context():
+        db.session.execute(db.insert(User), [
+            {'username': f'staff{i}', 'email': f'staff{i}@example.com',
+             'password_hash': generate_password_hash(f'password{i}', method),
+             'age': 40, 'gender': 'other', 'is_admin': False}
+            for i in range(count)
+        ])
+        db.session.commit()
+
+
+def post_logins(app, users, offset, window, start_barrier, results):
+    client = app.test_client()
+    ok = failed = 0
+    latencies = []
+    index = offset
+    start_barrier.wait()
+    while time.perf_counter() < window['deadline']:
+        user = index % users
+        index += 1
+        start = time.perf_counter()
+        response = client.post('/login', data={'email': f'staff{user}@example.com',
+                                               'password': f'password{user}'})
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code == 302:
+            ok += 1
+        else:
+            failed += 1
+        client.get('/logout')
+    results.append((ok, failed, latencies))
+
+
+def run(method, stored_method, users, threads, duration):
+    from models import db, User
+    from passwords import password_hasher
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'), PASSWORD_HASH_METHOD=method)
+        seed_users(app, users, stored_method)
+
+        results = []
+        # The window starts once every client is at the barrier, so it
+        # lasts the full duration
+        window = {}
+
+        def start_window():
+            window['started'] = time.perf_counter()
+            window['deadline'] = window['started'] + duration
+
+        barrier = threading.Barrier(threads + 1, action=start_window)
+        workers = [threading.Thread(target=post_logins,
+                                    args=(app, users, index * users // threads, window,
+                                          barrier, results))
+                   for index in range(threads)]
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        started = window['started']
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        with app.app_context():
+            upgraded = db.session.query(User)\
+                .filter(User.username.startswith('staff'),
+                        User.password_hash.startswith(password_hasher.stats()['method'] + '$'))\
+                .count()
+
+    ok = sum(r[0] for r in results)
+    latencies = sorted(latency for r in results for latency in r[2])
+    cores = min(os.cpu_count() or 1, password_hasher.threads)
+    return {
+        'method': method,
+        'stored_method': stored_method,
+        'logins': ok,
+        'failed': sum(r[1] for r in results),
+        'logins_per_s': round(ok / elapsed, 1),
+        'logins_per_s_per_core': round(ok / elapsed / cores, 1),
+        'median_ms': round(statistics.median(latencies), 1) if latencies else None,
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)], 1) if latencies else None,
+        'users_on_configured_method': upgraded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--methods', default=DEFAULT_METHODS,
+                        help="comma-separated werkzeug hash methods")
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=8, help="concurrent clients")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per method")
+    args = parser.parse_args()
+
+    from passwords import password_hasher
+
+    methods = args.methods.split(',')
+    results = [run(method, method, args.users, args.threads, args.duration)
+               for method in methods]
+    if len(methods) > 1:
+        results.append(run(methods[-1], methods[0], args.users, args.threads, args.duration))
+    print(json.dumps({
+        'cpu_count': os.cpu_count(),
+        'hash_threads': password_hasher.threads,
+        'results': results
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
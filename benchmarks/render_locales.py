@@ -0,0 +1,108 @@
+"""Page render time per locale, dashboard fragment caching and template
+compile time with and without the bytecode cache.
+
+For each locale with a catalog, times the landing page, /dashboard (with
+the per-user fragment cache disabled and enabled), /history and /admin
+through the test client. Then measures, in fresh interpreters, how long a
+new worker takes to load every template with an empty and a warm
+bytecode cache directory.
+
+    python benchmarks/render_locales.py
+    python benchmarks/render_locales.py --users 200 --records 20000 --repeat 50
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common import ROOT, make_app, seed, login_as, time_call
+
+PAGES = ['/', '/dashboard', '/history', '/admin']
+
+# Executed in a child interpreter; prints the template load time in ms
+COMPILE_CHILD = r'''
+import sys, time
+from app import create_app
+app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'MODEL_WARMUP': 'lazy',
+                  'TEMPLATE_BYTECODE_CACHE': sys.argv[1]})
+names = app.jinja_env.list_templates(extensions=['html'])
+start = time.perf_counter()
+for name in names:
+    app.jinja_env.get_template(name)
+print((time.perf_counter() - start) * 1000)
+'''
+
+
+def render_times(app, locales, user_ids, admin_id, repeat):
+    client = app.test_client()
+    results = {}
+    for locale in locales:
+        timings = {}
+        for page in PAGES:
+            samples = []
+            for user_id in (user_ids if page != '/admin' else [admin_id]):
+                login_as(client, user_id)
+                client.get(f'/?lang={locale}')
+                samples.append(time_call(lambda: client.get(page), repeat)['median_ms'])
+            timings[page] = round(statistics.median(samples), 3)
+        results[locale] = timings
+    return results
+
+
+def compile_times(cache, runs):
+    """Median template load time of `runs` fresh workers sharing `cache`"""
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-W', 'ignore', '-c', COMPILE_CHILD, cache],
+                                cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--samples', type=int, default=5, help="users timed per page")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=5, help="fresh interpreters per cache state")
+    args = parser.parse_args()
+
+    from models import User
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        app = make_app(db_path, RESPONSE_CACHE='none')
+        user_ids = seed(app, args.users, args.records)[:args.samples]
+        with app.app_context():
+            admin_id = User.query.filter_by(is_admin=True).first().id
+        locales = app.extensions['locales']
+        uncached = render_times(app, locales, user_ids, admin_id, args.repeat)
+        cached = render_times(make_app(db_path, INIT_DB=False), locales, user_ids, admin_id,
+                              args.repeat)
+
+        cache_dir = os.path.join(tmp, 'jinja')
+        cold = compile_times('none', args.workers)
+        compile_times(cache_dir, 1)  # fill the cache
+        warm = compile_times(cache_dir, args.workers)
+
+    print(json.dumps({
+        'users': args.users,
+        'records': args.records,
+        'render_ms': {
+            locale: {**uncached[locale],
+                     '/dashboard (fragment cached)': cached[locale]['/dashboard']}
+            for locale in locales
+        },
+        'template_load_ms': {
+            'no_bytecode_cache': round(statistics.median(cold), 2),
+            'warm_bytecode_cache': round(statistics.median(warm), 2),
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Session cookie size and per-request cost after a health submission.
+
+Compares the cookie that carried the whole last prediction (health data,
+recommendations and conditions) with the one that only references the
+stored record, and times a request that does nothing but load the session.
+
+    python benchmarks/session_cookie.py
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from common import make_app, seed, login_as, time_call
+
+FORM = {
+    'weight': '82', 'height': '165', 'systolic_bp': '165', 'diastolic_bp': '98',
+    'heart_rate': '105', 'blood_sugar': '210', 'cholesterol': '260', 'sleep_hours': '5',
+    'symptoms': 'Headache, Dizziness, Fatigue', 'medication': 'Amlodipine 5mg, Metformin 500mg',
+    'allergies': 'Penicillin', 'exercise_frequency': 'rarely'
+}
+
+
+def cookie_header(client, app):
+    cookie = client.get_cookie(app.config.get('SESSION_COOKIE_NAME', 'session'))
+    return f'{cookie.key}={cookie.value}'
+
+
+def measure(app, client, repeat):
+    header = cookie_header(client, app)
+    # /health/live touches nothing but the session, like a static asset would
+    timing = time_call(lambda: client.get('/health/live', headers={'Cookie': header}), repeat)
+    return {'cookie_header_bytes': len(header), **timing}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    from ml_model import analyze_health
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        user_id = seed(app, 1, 0)[0]
+        client = app.test_client()
+        login_as(client, user_id)
+        client.post('/input-health', data=FORM)
+        reference = measure(app, client, args.repeat)
+
+        # Rebuild the payload the session used to carry for the same reading
+        with app.app_context():
+            from app import parse_health_data
+            health_data = parse_health_data(FORM, 78)
+            risk_level, confidence, recommendations, conditions = analyze_health(health_data)
+        with client.session_transaction() as session:
+            session.pop('last_health_record_id')
+            session['last_prediction'] = {
+                'risk_level': risk_level,
+                'confidence': confidence,
+                'recommendations': recommendations,
+                'predicted_conditions': conditions,
+                'health_data': health_data
+            }
+        payload = measure(app, client, args.repeat)
+
+    print(json.dumps({'full_payload': payload, 'record_reference': reference}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Measure worker cold-start cost: import, app creation and first request.
+
+Each sample runs in a fresh interpreter so module import and model loading
+are measured from scratch, the way a newly forked worker would see them.
+
+    python benchmarks/startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in a child interpreter; prints one JSON line of timings
+CHILD = r'''
+import json, sys, time
+start = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+application = app_module.create_app({
+    'SQLALCHEMY_DATABASE_URI': sys.argv[1],
+    'MODEL_WARMUP': sys.argv[2],
+})
+created = time.perf_counter()
+client = application.test_client()
+client.post('/register', data={'username': 'bench', 'email': 'bench@example.com',
+                               'password': 'bench', 'age': '70', 'gender': 'other'})
+client.post('/login', data={'email': 'bench@example.com', 'password': 'bench'})
+logged_in = time.perf_counter()
+response = client.post('/input-health', data={
+    'weight': '70', 'height': '170', 'systolic_bp': '150', 'diastolic_bp': '95',
+    'heart_rate': '80', 'blood_sugar': '200', 'cholesterol': '250', 'sleep_hours': '5'})
+first_prediction = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - start,
+    'create_app_s': created - imported,
+    'first_prediction_s': first_prediction - logged_in,
+    'status': response.status_code,
+    'sklearn_imported': 'sklearn' in sys.modules,
+    'pandas_imported': 'pandas' in sys.modules,
+}))
+'''
+
+
+def run_once(warmup):
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD, uri, warmup],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warmup', choices=['lazy', 'background'], default='lazy')
+    args = parser.parse_args()
+
+    samples = [run_once(args.warmup) for _ in range(args.runs)]
+    summary = {'runs': args.runs, 'warmup': args.warmup}
+    for key in ('import_s', 'create_app_s', 'first_prediction_s'):
+        summary[key] = statistics.median(sample[key] for sample in samples)
+    summary['sklearn_imported'] = samples[-1]['sklearn_imported']
+    summary['pandas_imported'] = samples[-1]['pandas_imported']
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
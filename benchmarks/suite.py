@@ -0,0 +1,278 @@
+"""End-to-end benchmark suite for the web app and the model.
+
+Seeds a scratch SQLite database at the requested scale and measures, with
+the Flask test client and no network:
+
+- predict_risk latency for one reading and per batch size
+- /input-health throughput and latency
+- /dashboard, /history and /admin render time
+- /api/health-trends latency per range, with and without the response cache
+- model load time and worker RSS, per backend, in fresh interpreters
+
+Results are printed (or written with --output) as one JSON document with
+the git commit, Python version and scale, so runs can be kept per release.
+With --compare, the run is checked against an earlier result file and the
+script exits with status 1 if any timing got worse by more than
+--threshold:
+
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --compare before.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from common import ROOT, make_app, seed, login_as, time_call, history_page_path
+
+BATCH_SIZES = [1, 16, 64, 256, 1024]
+ROUTES = ['/dashboard', '/history']
+# History page reached by following cursors, timed as its own route
+DEEP_HISTORY_PAGE = 3
+TREND_QUERIES = ['/api/health-trends?range=30d', '/api/health-trends?range=1y',
+                 '/api/health-trends?range=5y']
+
+# Executed in a child interpreter per backend; prints one JSON line
+MODEL_CHILD = r'''
+import json, os, sys, time
+os.environ['HEALTH_MODEL_BACKEND'] = sys.argv[2]
+from ml_model import health_predictor
+start = time.perf_counter()
+health_predictor.load_model()
+loaded = time.perf_counter() - start
+from app import create_app
+app = create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1], 'MODEL_WARMUP': 'lazy'})
+client = app.test_client()
+client.post('/register', data={'username': 'bench', 'email': 'bench@example.com',
+                               'password': 'bench', 'age': '70', 'gender': 'other'})
+client.post('/login', data={'email': 'bench@example.com', 'password': 'bench'})
+client.post('/input-health', data={
+    'weight': '70', 'height': '170', 'systolic_bp': '150', 'diastolic_bp': '95',
+    'heart_rate': '80', 'blood_sugar': '200', 'cholesterol': '250', 'sleep_hours': '5'})
+client.get('/dashboard')
+with open('/proc/self/status') as f:
+    rss_kb = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+print(json.dumps({'backend': health_predictor.active_backend, 'load_s': loaded,
+                  'rss_mb': rss_kb / 1024}))
+'''
+
+
+def random_reading(rng):
+    return {
+        'age': rng.randint(60, 95), 'weight': rng.uniform(50, 120),
+        'systolic_bp': rng.randint(100, 200), 'diastolic_bp': rng.randint(60, 120),
+        'heart_rate': rng.randint(50, 120), 'blood_sugar': rng.uniform(70, 300),
+        'cholesterol': rng.uniform(150, 300), 'sleep_hours': rng.uniform(4, 10),
+    }
+
+
+def bench_predict(repeat):
+    """Raw model latency, bypassing the prediction cache"""
+    from ml_model import health_predictor
+
+    health_predictor.ensure_loaded()
+    rng = random.Random(0)
+    single = time_call(lambda: health_predictor.predict_risk(random_reading(rng)), repeat * 10)
+    batches = {}
+    for size in BATCH_SIZES:
+        records = [random_reading(rng) for _ in range(size)]
+        timing = time_call(lambda: health_predictor.predict_batch(records), repeat)
+        timing['per_record_us'] = round(timing['median_ms'] * 1000 / size, 2)
+        batches[str(size)] = timing
+    return {'single': single, 'batch': batches}
+
+
+def bench_input_health(app, user_ids, duration):
+    """Sequential submissions with varied readings for `duration` seconds"""
+    client = app.test_client()
+    rng = random.Random(1)
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        login_as(client, rng.choice(user_ids))
+        reading = random_reading(rng)
+        form = {name: str(round(value, 1)) for name, value in reading.items() if name != 'age'}
+        form['height'] = '170'
+        start = time.perf_counter()
+        response = client.post('/input-health', data=form)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 302 or not response.location.endswith('/analysis'):
+            errors += 1
+    latencies.sort()
+    return {
+        'submissions': len(latencies),
+        'errors': errors,
+        'throughput_per_s': round(len(latencies) / duration, 1),
+        'median_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)], 3),
+    }
+
+
+def bench_routes(app, user_ids, routes, samples, repeat, include_deep_history=False):
+    """Median over `samples` users of each route's median latency, plus
+    page DEEP_HISTORY_PAGE of /history if include_deep_history"""
+    client = app.test_client()
+    users = random.Random(2).sample(user_ids, min(samples, len(user_ids)))
+    routes = [(route, lambda route=route: route) for route in routes]
+    if include_deep_history:
+        routes.append((f'/history (page {DEEP_HISTORY_PAGE})',
+                       lambda: history_page_path(client, DEEP_HISTORY_PAGE)))
+    results = {}
+    for name, path_for_user in routes:
+        timings = []
+        for user_id in users:
+            login_as(client, user_id)
+            path = path_for_user()
+            timings.append(time_call(lambda: client.get(path), repeat))
+        results[name] = {
+            'median_ms': round(statistics.median(t['median_ms'] for t in timings), 3),
+            'p95_ms': round(max(t['p95_ms'] for t in timings), 3),
+        }
+    return results
+
+
+def bench_admin(app, repeat):
+    from models import User
+
+    with app.app_context():
+        admin_id = User.query.filter_by(is_admin=True).first().id
+    client = app.test_client()
+    login_as(client, admin_id)
+    return {route: time_call(lambda: client.get(route), repeat)
+            for route in ['/admin', '/admin?q=bench1']}
+
+
+def bench_model_load(db_path):
+    results = {}
+    for backend in ('compiled', 'sklearn'):
+        output = subprocess.run(
+            [sys.executable, '-W', 'ignore', '-c', MODEL_CHILD, 'sqlite:///' + db_path, backend],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        results[backend] = {
+            'active_backend': sample['backend'],
+            'load_s': round(sample['load_s'], 3),
+            'worker_rss_mb': round(sample['rss_mb'], 1),
+        }
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    """{'a': {'b_ms': 1}} -> {'a.b_ms': 1} for the numeric leaves"""
+    flat = {}
+    for key, value in results.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(baseline, current, threshold):
+    """Metrics that got worse by more than threshold (a fraction).
+
+    Times (_ms, _us, _s) and memory (_mb) should go down, throughput
+    (_per_s) up; other numbers, and the noisy p95s, are informational.
+    """
+    old = flatten(baseline['results'])
+    regressions = []
+    for path, value in flatten(current['results']).items():
+        before = old.get(path)
+        if not before or 'p95' in path:
+            continue
+        if path.endswith('_per_s'):
+            change = (before - value) / before
+        elif path.endswith(('_ms', '_us', '_s', '_mb')):
+            change = (value - before) / before
+        else:
+            continue
+        if change > threshold:
+            regressions.append({'metric': path, 'before': before, 'after': value,
+                                'change': round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--samples', type=int, default=10, help="users timed per route")
+    parser.add_argument('--repeat', type=int, default=20, help="requests per user and route")
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help="seconds of /input-health submissions")
+    parser.add_argument('--output', help="write the JSON results to this file")
+    parser.add_argument('--compare', help="earlier results to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="allowed slowdown before a metric counts as a regression")
+    args = parser.parse_args()
+
+    from rollups import rebuild_rollups
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        start = time.perf_counter()
+        app = make_app(db_path, RESPONSE_CACHE='none')
+        user_ids = seed(app, args.users, args.records)
+        with app.app_context():
+            rebuild_rollups()
+        seed_s = time.perf_counter() - start
+
+        results['predict_risk'] = bench_predict(args.repeat)
+        results['routes'] = bench_routes(app, user_ids, ROUTES, args.samples, args.repeat,
+                                         include_deep_history=True)
+        results['admin'] = bench_admin(app, args.repeat)
+        results['health_trends'] = bench_routes(app, user_ids, TREND_QUERIES, args.samples,
+                                                args.repeat)
+        cached = make_app(db_path, INIT_DB=False)
+        results['health_trends_cached'] = bench_routes(cached, user_ids, TREND_QUERIES,
+                                                       args.samples, args.repeat)
+        results['input_health'] = bench_input_health(app, user_ids, args.duration)
+        results['model_load'] = bench_model_load(db_path)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'users': args.users,
+            'records': args.records,
+            'seed_s': round(seed_s, 1),
+        },
+        'results': results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            report['regressions'] = compare(json.load(f), report, args.threshold)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
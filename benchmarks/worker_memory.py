@@ -0,0 +1,109 @@
+"""Compare per-host memory of N worker processes holding the risk model.
+
+Every worker loads the model the way a web worker would, scores a batch so
+all model pages are touched, then waits while the parent samples RSS and
+PSS from /proc/<pid>/smaps_rollup (Linux only). PSS splits shared pages
+between the processes mapping them, so its total is the real host cost.
+
+    python benchmarks/worker_memory.py --workers 1 4 16
+
+Both formats are read from the model registry's CURRENT version, published
+by `flask --app app init-db` or `python train_model.py`.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+MODES = ['pickle', 'compiled-private', 'compiled-mmap']
+
+# Executed in each worker; prints "ready" and blocks until stdin closes
+CHILD = r'''
+import sys
+import numpy as np
+mode, path = sys.argv[1:3]
+if mode == 'pickle':
+    import joblib
+    model = joblib.load(path)
+else:
+    from forest_engine import CompiledForest
+    model = CompiledForest.load(path,
+                                mmap_mode='r' if mode == 'compiled-mmap' else None)
+rng = np.random.default_rng(0)
+X = np.column_stack([rng.uniform(60, 95, 2000), rng.uniform(50, 120, 2000),
+                     rng.uniform(100, 200, 2000), rng.uniform(60, 120, 2000),
+                     rng.uniform(50, 120, 2000), rng.uniform(70, 300, 2000),
+                     rng.uniform(150, 300, 2000), rng.uniform(4, 10, 2000)])
+model.predict_proba(X)
+print('ready', flush=True)
+sys.stdin.read()
+'''
+
+
+def read_memory(pid):
+    """Return (rss_kb, pss_kb) for a process"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                values[parts[0][:-1]] = int(parts[1])
+    return values['Rss'], values['Pss']
+
+
+def model_paths():
+    """Mode -> artifact path in the registry's CURRENT version"""
+    import model_registry
+    registry = os.path.join(ROOT, model_registry.REGISTRY_PATH)
+    version = model_registry.current_version(registry)
+    if version is None:
+        sys.exit("No published model version; run `flask --app app init-db` or "
+                 "`python train_model.py --export-only` first")
+    directory = model_registry.version_path(version, registry)
+    return {'pickle': os.path.join(directory, model_registry.SKLEARN_MODEL),
+            'compiled-private': os.path.join(directory, model_registry.COMPILED_MODEL),
+            'compiled-mmap': os.path.join(directory, model_registry.COMPILED_MODEL)}
+
+
+def measure(mode, path, workers):
+    processes = [
+        subprocess.Popen([sys.executable, '-W', 'ignore', '-c', CHILD, mode, path], cwd=ROOT,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    try:
+        for process in processes:
+            process.stdout.readline()
+        samples = [read_memory(process.pid) for process in processes]
+    finally:
+        for process in processes:
+            process.stdin.close()
+            process.wait()
+    return {
+        'mode': mode,
+        'workers': workers,
+        'total_rss_mb': round(sum(rss for rss, _ in samples) / 1024, 1),
+        'total_pss_mb': round(sum(pss for _, pss in samples) / 1024, 1),
+        'pss_per_worker_mb': round(sum(pss for _, pss in samples) / 1024 / workers, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    args = parser.parse_args()
+
+    paths = model_paths()
+    results = [measure(mode, paths[mode], workers)
+               for mode in args.modes for workers in args.workers]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
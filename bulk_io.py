@@ -0,0 +1,206 @@
+"""Streaming bulk import and export of health records.
+
+Imports read CSV or JSONL row by row and write them in chunks: one
+multi-row INSERT per chunk for the records (and, optionally, one batched
+model call and INSERT for their predictions), with the trend rollups,
+per-user baselines and data versions updated and the chunk committed before the next one is
+read. Exports walk the records by id and yield text chunk by chunk, so
+neither direction holds more than one chunk in memory.
+"""
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from models import db, User, HealthRecord, Prediction, VITAL_FIELDS, TEXT_FIELDS, bump_data_version, \
+    parse_vital
+from rollups import update_rollups
+from baselines import update_baselines, format_anomalies
+import archive
+from ml_model import FEATURES, analyze_health_batch, health_predictor
+
+FORMATS = ('csv', 'jsonl')
+CHUNK_SIZE = 5000
+
+# Row errors returned in detail; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+PREDICTION_FIELDS = ['risk_level', 'confidence_score', 'predicted_conditions',
+                     'recommendations', 'model_version', 'predicted_at']
+EXPORT_FIELDS = ['id', 'user_id', 'recorded_at'] + list(VITAL_FIELDS) + TEXT_FIELDS \
+    + PREDICTION_FIELDS
+
+
+def format_for(filename, default='csv'):
+    """'csv' or 'jsonl' from a file name's extension"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    return 'csv' if extension == 'csv' else default
+
+
+def iter_rows(stream, fmt):
+    """Raw rows from a text stream: dicts for CSV, undecoded lines for JSONL"""
+    if fmt == 'csv':
+        return csv.DictReader(stream)
+    return (line for line in stream if line.strip())
+
+
+def parse_row(row, default_user_id=None):
+    """HealthRecord column values from one imported row"""
+    if isinstance(row, str):
+        row = json.loads(row)
+    values = {'user_id': int(row.get('user_id') or default_user_id)}
+    for name in VITAL_FIELDS:
+        values[name] = parse_vital(name, row[name])
+    for name in TEXT_FIELDS:
+        values[name] = str(row.get(name) or '')
+
+    recorded_at = row.get('recorded_at')
+    if recorded_at:
+        recorded_at = datetime.fromisoformat(recorded_at)
+        if recorded_at.tzinfo is not None:
+            # Stored timestamps are naive UTC
+            recorded_at = recorded_at.astimezone(timezone.utc).replace(tzinfo=None)
+    values['recorded_at'] = recorded_at or datetime.utcnow()
+    return values
+
+
+def import_records(rows, default_user_id=None, predict=False, chunk_size=CHUNK_SIZE):
+    """Insert rows from iter_rows() in committed chunks.
+
+    Rows that fail to parse or name an unknown user are skipped and
+    reported; earlier chunks stay committed if a later one fails.
+    Returns counts of imported, predicted and failed rows plus the first
+    MAX_REPORTED_ERRORS errors.
+    """
+    ages = {}  # user id -> age, for the users seen so far
+    result = {'imported': 0, 'predicted': 0, 'failed': 0, 'errors': []}
+
+    def fail(row_number, message):
+        result['failed'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'row': row_number, 'error': message})
+
+    chunk = []
+    for row_number, row in enumerate(rows, 1):
+        try:
+            chunk.append((row_number, parse_row(row, default_user_id)))
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            fail(row_number, str(e) or type(e).__name__)
+        if len(chunk) >= chunk_size:
+            _import_chunk(chunk, ages, predict, fail, result)
+            chunk = []
+    if chunk:
+        _import_chunk(chunk, ages, predict, fail, result)
+    return result
+
+
+def _import_chunk(chunk, ages, predict, fail, result):
+    unknown = {values['user_id'] for _, values in chunk} - ages.keys()
+    if unknown:
+        ages.update(db.session.query(User.id, User.age).filter(User.id.in_(unknown)).all())
+    records = []
+    for row_number, values in chunk:
+        if values['user_id'] in ages:
+            records.append(values)
+        else:
+            fail(row_number, f"Unknown user {values['user_id']}")
+    if not records:
+        return
+
+    # Same order as input_health: the baselines give the anomalies stored
+    # with each record, and the rollups follow the INSERT
+    readings = [SimpleNamespace(**values) for values in records]
+    for values, anomalies in zip(records, update_baselines(readings)):
+        values['anomalies'] = format_anomalies(anomalies)
+    if not predict:
+        db.session.execute(db.insert(HealthRecord), records)
+    else:
+        # Ordered RETURNING costs a statement per row on some backends, so
+        # only ask for the new ids when predictions need them
+        ids = db.session.execute(
+            db.insert(HealthRecord).returning(HealthRecord.id, sort_by_parameter_order=True),
+            records
+        ).scalars().all()
+        features = [{**{name: values[name] for name in FEATURES if name != 'age'},
+                     'age': ages[values['user_id']]} for values in records]
+        model = health_predictor.ensure_loaded()
+        predictions = []
+        for record_id, values, analysis in zip(ids, records, analyze_health_batch(features, model)):
+            risk_level, confidence, recommendations, predicted_conditions = analysis
+            predictions.append({
+                'user_id': values['user_id'],
+                'health_record_id': record_id,
+                'risk_level': risk_level,
+                'predicted_conditions': ', '.join(predicted_conditions),
+                'confidence_score': confidence,
+                'recommendations': '; '.join(recommendations),
+                'model_version': model.version
+            })
+        db.session.execute(db.insert(Prediction), predictions)
+        result['predicted'] += len(predictions)
+    update_rollups(readings)
+
+    bump_data_version(values['user_id'] for values in records)
+    db.session.commit()
+    result['imported'] += len(records)
+
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def export_records(user_id=None, fmt='csv', chunk_size=CHUNK_SIZE):
+    """Yield a CSV or JSONL export of records and their predictions, one
+    chunk of text per chunk_size records: live records by id, then
+    archived ones by user and date"""
+    record_fields = EXPORT_FIELDS[:-len(PREDICTION_FIELDS)]
+    query = db.session.query(*[getattr(HealthRecord, name) for name in record_fields])
+    if user_id is not None:
+        query = query.filter(HealthRecord.user_id == user_id)
+    prediction_columns = [getattr(Prediction, name) for name in PREDICTION_FIELDS]
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(EXPORT_FIELDS)
+
+    def write(rows):
+        for row in rows:
+            values = [_export_value(value) for value in row]
+            if fmt == 'csv':
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, values))) + '\n')
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    # Chunks are pages of records; their predictions are loaded separately
+    # so a record with several is never split across two chunks
+    last_id = 0
+    while True:
+        records = query.filter(HealthRecord.id > last_id)\
+            .order_by(HealthRecord.id).limit(chunk_size).all()
+        if not records:
+            break
+        last_id = records[-1].id
+        predictions = {}
+        for row in db.session.query(Prediction.health_record_id, *prediction_columns)\
+                .filter(Prediction.health_record_id.in_([record.id for record in records]))\
+                .order_by(Prediction.health_record_id, Prediction.id):
+            predictions.setdefault(row.health_record_id, []).append(tuple(row)[1:])
+        empty = (None,) * len(PREDICTION_FIELDS)
+        yield write(tuple(record) + prediction
+                    for record in records
+                    for prediction in predictions.get(record.id, [empty]))
+
+    for records in archive.iter_chunks(archive.iter_archived(user_id), chunk_size):
+        yield write([getattr(record, name) for name in record_fields]
+                    + [getattr(record.prediction[0], name) if record.prediction else None
+                       for name in PREDICTION_FIELDS]
+                    for record in records)
+    if buffer.tell():
+        yield buffer.getvalue()
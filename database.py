@@ -0,0 +1,70 @@
+"""Database URL, connection pool and SQLite tuning from the environment.
+
+SQLite is opened in WAL mode with synchronous=NORMAL and a busy timeout,
+so readers never block the writer and concurrent writers wait for the
+lock instead of failing with "database is locked". Server databases such
+as PostgreSQL get a bounded, pre-pinged connection pool sized per worker.
+"""
+import os
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+
+DEFAULT_DATABASE_URI = 'sqlite:///health_assistant.db'
+
+# Applied to every new SQLite connection, in this order
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('CARENEST_SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('CARENEST_SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('CARENEST_SQLITE_BUSY_TIMEOUT_MS', '10000')),
+    'cache_size': -20000,  # KiB, i.e. ~20 MB of page cache per connection
+    'temp_store': 'MEMORY',
+}
+
+# INSERT constructs with ON CONFLICT support, by SQLAlchemy dialect name
+UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def database_uri():
+    """SQLALCHEMY_DATABASE_URI or DATABASE_URL, defaulting to a local SQLite file"""
+    uri = (os.environ.get('SQLALCHEMY_DATABASE_URI') or os.environ.get('DATABASE_URL')
+           or DEFAULT_DATABASE_URI)
+    # Heroku-style URLs use a scheme SQLAlchemy no longer accepts
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def engine_options(uri):
+    """create_engine() keyword arguments suited to the database in `uri`"""
+    if uri.startswith('sqlite'):
+        # The sqlite3 driver's own lock wait, in seconds, matching busy_timeout
+        return {'connect_args': {'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000}}
+    return {
+        # Per worker process: keep pool_size * workers below the server's
+        # max_connections
+        'pool_size': int(os.environ.get('CARENEST_DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.environ.get('CARENEST_DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': int(os.environ.get('CARENEST_DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.environ.get('CARENEST_DB_POOL_RECYCLE', '1800')),
+        # Replace connections dropped by the server or a proxy while idle
+        'pool_pre_ping': True,
+    }
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def configure_engine(engine):
+    """Register the connect-time tuning for `engine`"""
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', set_sqlite_pragmas)
+
+
+def upsert_insert(dialect, table):
+    """INSERT into `table` with on_conflict_do_update()/_do_nothing() for
+    `dialect` (SQLite or PostgreSQL)"""
+    return UPSERT_INSERTS[dialect.name](table)
@@ -0,0 +1,166 @@
+"""Dependency-light inference engine for the health risk RandomForest.
+
+The trained forest is flattened into a handful of NumPy arrays (one entry
+per node across all trees) so predictions only need NumPy: no sklearn
+import, no per-tree Python dispatch and no estimator input validation.
+
+The arrays are saved as individual .npy files in one directory so they can
+be memory-mapped read-only: every worker process on a host then shares the
+same page-cache copy of the model instead of holding its own.
+"""
+import json
+import os
+import shutil
+import numpy as np
+
+# Arrays stored in the exported artifact, one <name>.npy file each
+ARRAY_NAMES = ['feature', 'threshold', 'children', 'value', 'roots', 'classes']
+METADATA_FILE = 'forest.json'
+
+# Rows evaluated together; larger batches are split into chunks of this size
+CHUNK_SIZE = 256
+
+
+class CompiledForest:
+    """Flattened random forest evaluated for a whole batch at once"""
+
+    def __init__(self, feature, threshold, children, value, roots, classes, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        # Interleaved children: children[2 * node] is left, [2 * node + 1] right
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = int(max_depth)
+
+    @classmethod
+    def from_sklearn(cls, model, classes=None):
+        """Flatten a fitted RandomForestClassifier.
+
+        `classes` optionally maps the model's encoded classes to labels
+        (e.g. LabelEncoder.classes_) so decoding needs no sklearn either.
+        """
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            # Leaves point at themselves, so extra traversal steps are no-ops
+            pairs = np.empty((tree.node_count, 2), dtype=np.intp)
+            pairs[:, 0] = np.where(is_leaf, node_ids, tree.children_left) + offset
+            pairs[:, 1] = np.where(is_leaf, node_ids, tree.children_right) + offset
+
+            # Per-node class probabilities, normalized the way
+            # DecisionTreeClassifier.predict_proba does it
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            children.append(pairs.ravel())
+            values.append(value / normalizer)
+            roots.append(offset)
+
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        labels = np.asarray(model.classes_)
+        if classes is not None:
+            labels = np.asarray(classes)[labels]
+        # Store labels as plain strings so loading never needs pickle
+        labels = labels.astype(str)
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate(children),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.intp),
+            classes=labels,
+            max_depth=max_depth
+        )
+
+    def save(self, directory):
+        """Write each array to <directory>/<name>.npy plus a small metadata file.
+
+        The files are written to a sibling directory which is then swapped
+        in, so processes that have the old arrays mapped are never handed a
+        truncated file.
+        """
+        staging = directory + '.tmp'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name in ARRAY_NAMES:
+            array = self.classes_ if name == 'classes' else getattr(self, name)
+            np.save(os.path.join(staging, name + '.npy'), np.ascontiguousarray(array))
+        with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+            json.dump({'max_depth': self.max_depth, 'n_trees': len(self.roots),
+                       'n_nodes': len(self.feature)}, f)
+
+        previous = directory + '.old'
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(directory):
+            os.rename(directory, previous)
+        os.rename(staging, directory)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    @staticmethod
+    def exists(directory):
+        """True if a complete exported forest is present in directory"""
+        return os.path.exists(os.path.join(directory, METADATA_FILE))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Load a forest written by save().
+
+        With the default mmap_mode='r' the arrays are mapped read-only
+        instead of copied into this process; pass None to read them into
+        private memory.
+        """
+        with open(os.path.join(directory, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        arrays = {}
+        for name in ARRAY_NAMES:
+            array = np.load(os.path.join(directory, name + '.npy'),
+                            mmap_mode=mmap_mode, allow_pickle=False)
+            # Plain ndarray view of the mapping; avoids np.memmap overhead per op
+            arrays[name] = np.asarray(array)
+        return cls(max_depth=metadata['max_depth'], **arrays)
+
+    def apply(self, X):
+        """Return the leaf index reached in every tree, shape (n_samples, n_trees)"""
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        n_samples, n_features = X.shape
+        flat_X = X.ravel()
+        row_offsets = (np.arange(n_samples) * n_features)[:, None]
+        nodes = np.broadcast_to(self.roots, (n_samples, len(self.roots)))
+        for _ in range(self.max_depth):
+            values = np.take(flat_X, row_offsets + np.take(self.feature, nodes))
+            go_right = ~(values <= np.take(self.threshold, nodes))
+            nodes = np.take(self.children, 2 * nodes + go_right)
+        return nodes
+
+    def predict_proba(self, X):
+        """Average the leaf class probabilities over all trees"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        # Evaluate in chunks so the per-tree node arrays stay cache resident
+        chunks = []
+        for start in range(0, len(X), CHUNK_SIZE):
+            leaves = self.apply(X[start:start + CHUNK_SIZE])
+            # Summing over the tree axis adds trees in order, like sklearn
+            chunks.append(np.take(self.value, leaves, axis=0).sum(axis=1) / leaves.shape[1])
+        if not chunks:
+            return np.zeros((0, self.value.shape[1]))
+        return np.concatenate(chunks)
+
+    def predict(self, X):
+        """Most probable class label for each sample"""
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
@@ -0,0 +1,98 @@
+"""Locale selection and gettext catalogs for the templates.
+
+The compiled catalogs in translations/<locale>/LC_MESSAGES/messages.mo are
+parsed once per process, when the app is created, and templates translate
+with the Jinja i18n extension: {{ _('Dashboard') }}. The locale of a
+request comes from ?lang= (remembered in the session), then the session,
+then the browser's Accept-Language header, then DEFAULT_LOCALE.
+
+To add or update strings, extract them with Babel and recompile:
+
+    pybabel extract -F babel.cfg -o messages.pot .
+    pybabel update -i messages.pot -d translations
+    pybabel compile -d translations
+"""
+import gettext as gettext_module
+import os
+from functools import lru_cache
+from flask import current_app, g, request, session, has_request_context
+
+# Names shown in the language menu, in each language
+LANGUAGE_NAMES = {
+    'en': 'English',
+    'bn': 'বাংলা',
+    'hi': 'हिन्दी',
+    'ta': 'தமிழ்',
+    'te': 'తెలుగు'
+}
+
+
+@lru_cache(maxsize=None)
+def get_translations(directory, locale):
+    """Parsed catalog of a locale (NullTranslations if there is none)"""
+    return gettext_module.translation('messages', directory, [locale], fallback=True)
+
+
+def available_locales(directory, default='en'):
+    """The default locale plus every locale with a compiled catalog"""
+    locales = [default]
+    if os.path.isdir(directory):
+        for name in sorted(os.listdir(directory)):
+            if name != default and \
+                    os.path.isfile(os.path.join(directory, name, 'LC_MESSAGES', 'messages.mo')):
+                locales.append(name)
+    return locales
+
+
+def get_locale():
+    if has_request_context() and 'locale' in g:
+        return g.locale
+    return current_app.config['DEFAULT_LOCALE']
+
+
+def translations():
+    return get_translations(current_app.config['TRANSLATIONS_DIR'], get_locale())
+
+
+def gettext(message):
+    return translations().gettext(message)
+
+
+def ngettext(singular, plural, n):
+    return translations().ngettext(singular, plural, n)
+
+
+def _select_locale():
+    locales = current_app.extensions['locales']
+    requested = request.args.get('lang')
+    if requested in locales:
+        session['lang'] = requested
+    locale = session.get('lang')
+    if locale not in locales:
+        locale = request.accept_languages.best_match(locales) \
+            or current_app.config['DEFAULT_LOCALE']
+    g.locale = locale
+
+
+def _template_context():
+    locale = get_locale()
+    return {
+        'locale': locale,
+        'locale_name': LANGUAGE_NAMES.get(locale, locale),
+        'languages': [(code, LANGUAGE_NAMES.get(code, code))
+                      for code in current_app.extensions['locales']]
+    }
+
+
+def init_app(app):
+    """Load the catalogs and translate app's templates per request"""
+    directory = app.config['TRANSLATIONS_DIR']
+    locales = available_locales(directory, app.config['DEFAULT_LOCALE'])
+    for locale in locales:
+        get_translations(directory, locale)
+    app.extensions['locales'] = locales
+
+    app.jinja_env.add_extension('jinja2.ext.i18n')
+    app.jinja_env.install_gettext_callables(gettext, ngettext, newstyle=True)
+    app.before_request(_select_locale)
+    app.context_processor(_template_context)
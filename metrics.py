@@ -0,0 +1,222 @@
+"""Prometheus metrics and sampled request profiling.
+
+Every request records its latency, the number and total time of its SQL
+queries (counted with SQLAlchemy cursor events) and the time spent
+rendering each template, labelled by route. The model records inference
+time and batch size, and the caches and background pools are exported as
+gauges when /metrics is scraped. Metrics are kept per process, like the
+caches they describe.
+
+With PROFILE_SAMPLE_RATE above 0, that fraction of requests also runs
+under cProfile and the stats are written to PROFILE_DIR, one .prof file
+per request, for `python -m pstats` or snakeviz.
+"""
+import bisect
+import cProfile
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from flask import current_app, g, request, has_request_context
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096)
+
+# Keys of stats() dicts that only ever grow, exported as counters
+COUNTER_KEYS = {'hits', 'misses', 'evictions', 'expirations', 'processed', 'batches', 'failed',
+                'hashed', 'verified', 'rejected'}
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {value}'
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            series = sorted((labels, (list(counts), total, count))
+                            for labels, (counts, total, count) in self._series.items())
+        names = self.labels + ('le',)
+        for label_values, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{_format_labels(names, label_values + (bound,))} {cumulative}'
+            labels = _format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {total}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+request_latency = Histogram('carenest_request_duration_seconds',
+                            'Request latency by route, method and status.',
+                            ('route', 'method', 'status'))
+request_queries = Histogram('carenest_request_sql_queries', 'SQL queries per request.',
+                            ('route',), QUERY_COUNT_BUCKETS)
+request_query_time = Histogram('carenest_request_sql_seconds', 'SQL time per request.',
+                               ('route',))
+template_render_time = Histogram('carenest_template_render_seconds',
+                                 'Template rendering time.', ('template',))
+inference_time = Histogram('carenest_model_inference_seconds',
+                           'Model inference time per batch.', ('backend',))
+inference_batch_size = Histogram('carenest_model_batch_size',
+                                 'Readings per model inference call.', ('backend',),
+                                 BATCH_SIZE_BUCKETS)
+profiled_requests = Counter('carenest_profiled_requests_total',
+                            'Requests run under the sampling profiler.', ('route',))
+
+METRICS = [request_latency, request_queries, request_query_time, template_render_time,
+           inference_time, inference_batch_size, profiled_requests]
+
+# name -> function returning a stats() dict, read at scrape time
+_stats_sources = {}
+
+
+def register_stats(name, stats):
+    """Export the numeric values of stats() as carenest_<name>_<key>"""
+    _stats_sources[name] = stats
+
+
+def observe_inference(backend, batch_size, seconds):
+    inference_time.observe(seconds, backend)
+    inference_batch_size.observe(batch_size, backend)
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+# The start time lives on the statement's execution context, not on the
+# pooled connection, so a statement that fails leaves nothing behind to be
+# paired with a later one
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_query_start
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_queries += 1
+        g.metrics_query_time += elapsed
+
+
+def _before_render(sender, template, context, **extra):
+    g.setdefault('metrics_render_starts', []).append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    starts = g.get('metrics_render_starts')
+    if starts:
+        template_render_time.observe(time.perf_counter() - starts.pop(), template.name)
+
+
+def _start_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_query_time = 0.0
+    rate = current_app.config['PROFILE_SAMPLE_RATE']
+    if rate and random.random() < rate:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _finish_request(response):
+    if 'metrics_start' not in g:
+        # An earlier before_request hook answered the request
+        return response
+    elapsed = time.perf_counter() - g.metrics_start
+    route = _route()
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _save_profile(profiler, elapsed)
+        profiled_requests.inc(1, route)
+    request_latency.observe(elapsed, route, request.method, str(response.status_code))
+    request_queries.observe(g.metrics_queries, route)
+    request_query_time.observe(g.metrics_query_time, route)
+    return response
+
+
+def _save_profile(profiler, elapsed):
+    directory = current_app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{request.endpoint or 'unmatched'}-" \
+           f"{elapsed * 1000:.0f}ms.prof"
+    profiler.dump_stats(os.path.join(directory, name))
+
+
+def init_app(app, engine):
+    """Record request, SQL and template metrics for app (and engine)"""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for source, stats in _stats_sources.items():
+        for key, value in (stats() or {}).items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f'carenest_{source}_{key}'
+            kind = 'gauge'
+            if key in COUNTER_KEYS:
+                name += '_total'
+                kind = 'counter'
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
@@ -1,139 +1,509 @@
 import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import train_test_split
-import joblib
 import os
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from forest_engine import CompiledForest
+from ttl_cache import TTLCache
+from rules import get_rule_engine
+import metrics
+import model_registry
+
+# Feature order expected by the trained model
+FEATURES = ['age', 'weight', 'systolic_bp', 'diastolic_bp',
+            'heart_rate', 'blood_sugar', 'cholesterol', 'sleep_hours']
+
+# Unversioned artifacts in the working directory, served when no version
+# has been published to the model registry yet
+MODEL_PATH = 'health_risk_model.pkl'
+ENCODER_PATH = 'label_encoder.pkl'
+COMPILED_MODEL_PATH = 'health_risk_model.forest'
+
+# How often a serving worker checks the registry for a new current version
+RELOAD_CHECK_SECONDS = float(os.environ.get('HEALTH_MODEL_RELOAD_CHECK_SECONDS', '5'))
+
+# Default (low, high, kind) ranges for generated training data; 'int'
+# columns are drawn with randint (high exclusive), 'float' with uniform
+SAMPLE_FEATURE_RANGES = {
+    'age': (60, 95, 'int'),
+    'weight': (50, 120, 'int'),
+    'systolic_bp': (100, 200, 'int'),
+    'diastolic_bp': (60, 120, 'int'),
+    'heart_rate': (50, 120, 'int'),
+    'blood_sugar': (70, 300, 'float'),
+    'cholesterol': (150, 300, 'float'),
+    'sleep_hours': (4, 10, 'float')
+}
+
+# Decimal places kept when normalizing features for the prediction cache;
+# near-identical readings share one cache entry
+NORMALIZATION_DECIMALS = {
+    'age': 0,
+    'weight': 1,
+    'systolic_bp': 0,
+    'diastolic_bp': 0,
+    'heart_rate': 0,
+    'blood_sugar': 1,
+    'cholesterol': 1,
+    'sleep_hours': 1
+}
+
+# Inference backends: 'sklearn' uses the pickled estimator, 'compiled' the
+# flattened NumPy forest (memory-mapped, shared between worker processes),
+# 'auto' prefers compiled when it has been exported
+BACKENDS = ('auto', 'sklearn', 'compiled')
+
+def file_fingerprint(paths):
+    """SHA-256 of the given files' contents; directories are hashed file by file"""
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+        else:
+            files = [path]
+        for name in files:
+            digest.update(os.path.basename(name).encode())
+            with open(name, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+    return digest.hexdigest()
+
+def normalize_features(health_data):
+    """Round the model features so near-identical readings compare equal"""
+    normalized = dict(health_data)
+    for name, decimals in NORMALIZATION_DECIMALS.items():
+        normalized[name] = round(float(health_data[name]), decimals)
+    return normalized
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None if unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+@contextmanager
+def training_phase(name):
+    """Print wall time and peak memory after a training phase"""
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    peak = peak_rss_mb()
+    memory = f"{peak:.0f} MB" if peak is not None else "n/a"
+    print(f"[{name}] {elapsed:.2f}s, peak RSS {memory}")
+
+def load_training_data(path):
+    """Read imported training rows (FEATURES, optional risk_level) from a CSV file"""
+    import pandas as pd
+    columns = pd.read_csv(path, nrows=0).columns
+    usecols = FEATURES + (['risk_level'] if 'risk_level' in columns else [])
+    return pd.read_csv(path, usecols=usecols,
+                       dtype={name: np.float32 for name in FEATURES})
+
+# Model predictions keyed on the loaded model's fingerprint and the
+# normalized features, so a new model never serves stale entries
+prediction_cache = TTLCache(
+    max_size=int(os.environ.get('PREDICTION_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('PREDICTION_CACHE_TTL', 3600))
+)
+
+class LoadedModel:
+    """One loaded model version. A reload builds a new instance and swaps it
+    in whole, so a request never mixes the estimator of one version with
+    the classes or fingerprint of another."""
+    def __init__(self, model, classes, backend, fingerprint, version, label_encoder=None):
+        self.model = model
+        self.classes = classes
+        self.backend = backend
+        self.fingerprint = fingerprint
+        self.version = version
+        self.label_encoder = label_encoder
 
 class HealthRiskPredictor:
-    def __init__(self):
-        self.model = None
-        self.label_encoder = LabelEncoder()
-        self.is_trained = False
+    def __init__(self, backend=None):
+        self.loaded = None
+        self.backend = backend or os.environ.get('HEALTH_MODEL_BACKEND', 'auto')
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown model backend: {self.backend}")
+        self._load_lock = threading.Lock()
+        self._warmup_thread = None
+        self._reload_thread = None
+        self._next_reload_check = 0.0
+        self._failed_version = None
+    
+    @property
+    def is_trained(self):
+        return self.loaded is not None
+    
+    @property
+    def active_backend(self):
+        return self.loaded.backend if self.loaded else None
+    
+    @property
+    def model_fingerprint(self):
+        return self.loaded.fingerprint if self.loaded else None
+    
+    @property
+    def model_version(self):
+        return self.loaded.version if self.loaded else None
         
-    def generate_sample_data(self):
-        """Generate sample training data for demonstration"""
-        np.random.seed(42)
-        n_samples = 1000
+    def generate_sample_data(self, n_samples=1000, seed=42, feature_ranges=None):
+        """Generate sample training data for demonstration.
+
+        Columns are drawn one at a time as whole vectors and stored as
+        float32 (the precision the forest trains on), so millions of rows
+        stay cheap. `feature_ranges` overrides entries of
+        SAMPLE_FEATURE_RANGES.
+        """
+        import pandas as pd
+        rng = np.random.RandomState(seed)
+        ranges = dict(SAMPLE_FEATURE_RANGES, **(feature_ranges or {}))
         
-        data = {
-            'age': np.random.randint(60, 95, n_samples),
-            'weight': np.random.randint(50, 120, n_samples),
-            'systolic_bp': np.random.randint(100, 200, n_samples),
-            'diastolic_bp': np.random.randint(60, 120, n_samples),
-            'heart_rate': np.random.randint(50, 120, n_samples),
-            'blood_sugar': np.random.uniform(70, 300, n_samples),
-            'cholesterol': np.random.uniform(150, 300, n_samples),
-            'sleep_hours': np.random.uniform(4, 10, n_samples),
-        }
+        data = {}
+        for name in FEATURES:
+            low, high, kind = ranges[name]
+            if kind == 'int':
+                column = rng.randint(low, high, n_samples)
+            else:
+                column = rng.uniform(low, high, n_samples)
+            data[name] = column.astype(np.float32)
         
         df = pd.DataFrame(data)
         
-        # Simulate risk levels based on health parameters
-        def calculate_risk(row):
-            risk_score = 0
-            if row['systolic_bp'] > 140 or row['diastolic_bp'] > 90:
-                risk_score += 2
-            if row['blood_sugar'] > 180:
-                risk_score += 2
-            if row['cholesterol'] > 240:
-                risk_score += 1
-            if row['heart_rate'] > 100 or row['heart_rate'] < 60:
-                risk_score += 1
-            if row['age'] > 75:
-                risk_score += 1
-            if row['sleep_hours'] < 6:
-                risk_score += 1
-                
-            if risk_score >= 4:
-                return 'high'
-            elif risk_score >= 2:
-                return 'medium'
-            else:
-                return 'low'
-        
-        df['risk_level'] = df.apply(calculate_risk, axis=1)
+        # Simulate risk levels with the same rule table used for advice
+        df['risk_level'] = get_rule_engine().risk_levels(df)
         return df
     
-    def train_model(self):
-        """Train the machine learning model"""
+    def train_model(self, n_samples=1000, seed=42, n_estimators=100, n_jobs=None,
+                    chunk_size=None, feature_ranges=None, data=None, min_samples_leaf=1,
+                    activate=True):
+        """Train the machine learning model and publish it as a new version.
+
+        Trains on `data` (a DataFrame with FEATURES and optionally
+        risk_level) or on `n_samples` generated rows. With `chunk_size` the
+        forest is grown with warm_start, adding a share of the trees per
+        chunk of training rows, so each fit only touches one chunk. With
+        `activate` the new version becomes current (and is loaded here);
+        running workers switch to it in the background. Returns the
+        version name, or None if training failed.
+        """
+        # sklearn is only needed for training and the 'sklearn' backend
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.preprocessing import LabelEncoder
+        from sklearn.model_selection import train_test_split
+
         try:
-            # Generate sample data
-            df = self.generate_sample_data()
+            with training_phase("data"):
+                if data is None:
+                    df = self.generate_sample_data(n_samples, seed, feature_ranges)
+                else:
+                    df = data
+                    if 'risk_level' not in df:
+                        df['risk_level'] = get_rule_engine().risk_levels(df)
+                print(f"Training rows: {len(df)}")
             
-            # Prepare features and target
-            features = ['age', 'weight', 'systolic_bp', 'diastolic_bp', 
-                       'heart_rate', 'blood_sugar', 'cholesterol', 'sleep_hours']
-            X = df[features]
-            y = self.label_encoder.fit_transform(df['risk_level'])
-            
-            # Split data
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-            
-            # Train model
-            self.model = RandomForestClassifier(n_estimators=100, random_state=42)
-            self.model.fit(X_train, y_train)
+            with training_phase("prepare"):
+                # Prepare features and target
+                X = df[FEATURES].to_numpy(dtype=np.float32)
+                label_encoder = LabelEncoder()
+                y = label_encoder.fit_transform(df['risk_level'])
+                del df
+                
+                # Split data
+                X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+                del X, y
             
-            # Calculate accuracy
-            accuracy = self.model.score(X_test, y_test)
-            print(f"Model trained with accuracy: {accuracy:.2f}")
+            with training_phase("fit"):
+                # Train model
+                model = RandomForestClassifier(
+                    n_estimators=n_estimators, random_state=42, n_jobs=n_jobs,
+                    min_samples_leaf=min_samples_leaf)
+                if chunk_size and chunk_size < len(X_train):
+                    self._fit_in_chunks(model, X_train, y_train, n_estimators, chunk_size)
+                else:
+                    model.fit(X_train, y_train)
             
-            self.is_trained = True
+            with training_phase("evaluate"):
+                # Calculate accuracy
+                accuracy = model.score(X_test, y_test)
+                print(f"Model trained with accuracy: {accuracy:.2f}")
             
-            # Save model
-            joblib.dump(self.model, 'health_risk_model.pkl')
-            joblib.dump(self.label_encoder, 'label_encoder.pkl')
+            with training_phase("save"):
+                version = self.publish(model, label_encoder, activate=activate, info={
+                    'accuracy': accuracy,
+                    'training_rows': len(X_train),
+                    'n_estimators': n_estimators,
+                    'min_samples_leaf': min_samples_leaf
+                })
+            return version
             
         except Exception as e:
             print(f"Error training model: {e}")
+            return None
+    
+    def _fit_in_chunks(self, model, X_train, y_train, n_estimators, chunk_size):
+        """Grow the forest chunk by chunk with warm_start.
+
+        Chunks are stratified by risk level: trees fitted on a chunk
+        missing a class would be built over a different classes_ than the
+        rest of the forest, so such a chunk raises ValueError instead.
+        """
+        from sklearn.model_selection import StratifiedKFold
+
+        n_chunks = -(-len(X_train) // chunk_size)
+        trees_per_chunk = max(1, -(-n_estimators // n_chunks))
+        n_classes = int(y_train.max()) + 1
+        chunks = StratifiedKFold(n_splits=n_chunks, shuffle=True, random_state=42)\
+            .split(np.zeros(len(y_train)), y_train)
+        model.set_params(warm_start=True)
+        for index, (_, rows) in enumerate(chunks):
+            trees = min(n_estimators, (index + 1) * trees_per_chunk)
+            if trees == model.n_estimators and index > 0:
+                print(f"All {n_estimators} trees grown after {index} chunks")
+                break
+            if np.count_nonzero(np.bincount(y_train[rows], minlength=n_classes)) < n_classes:
+                raise ValueError(f"Training chunk {index + 1}/{n_chunks} lacks a risk level; "
+                                 f"use a larger chunk size or more training rows")
+            model.set_params(n_estimators=trees)
+            model.fit(X_train[rows], y_train[rows])
+            print(f"  chunk {index + 1}/{n_chunks}: {trees} trees")
+        model.set_params(warm_start=False)
+    
+    def publish(self, model, label_encoder, info=None, activate=True):
+        """Publish a fitted forest (pickle, label encoder and compiled export)
+        to the model registry; returns the version name"""
+        import joblib
+        
+        def write_artifacts(directory):
+            joblib.dump(model, os.path.join(directory, model_registry.SKLEARN_MODEL))
+            joblib.dump(label_encoder, os.path.join(directory, model_registry.LABEL_ENCODER))
+            forest = CompiledForest.from_sklearn(model, label_encoder.classes_)
+            forest.save(os.path.join(directory, model_registry.COMPILED_MODEL))
+        
+        info = dict(info or {}, classes=[str(name) for name in label_encoder.classes_])
+        version = model_registry.publish(write_artifacts, info=info, activate=activate)
+        print(f"Published model version {version}" + (" (current)" if activate else ""))
+        if activate:
+            self._activate(self._load(version))
+        return version
+    
+    def export_compiled(self, activate=True):
+        """Publish the loaded sklearn model as a new version with a fresh
+        compiled export, e.g. to move unversioned artifacts into the registry"""
+        loaded = self.ensure_loaded()
+        if loaded.label_encoder is None:
+            raise ValueError("Exporting needs the sklearn model; load it with backend='sklearn'")
+        return self.publish(loaded.model, loaded.label_encoder, activate=activate,
+                            info={'exported_from': loaded.version})
+    
+    def _artifact_paths(self, version):
+        """(compiled, sklearn model, label encoder) paths of a version, or
+        of the unversioned files when version is None"""
+        if version is None:
+            return COMPILED_MODEL_PATH, MODEL_PATH, ENCODER_PATH
+        directory = model_registry.version_path(version)
+        return (os.path.join(directory, model_registry.COMPILED_MODEL),
+                os.path.join(directory, model_registry.SKLEARN_MODEL),
+                os.path.join(directory, model_registry.LABEL_ENCODER))
+    
+    def _load(self, version):
+        """Load a registry version (None: the unversioned files) with the
+        configured backend; raises if no usable model is found"""
+        compiled_path, model_path, encoder_path = self._artifact_paths(version)
+        if self.backend != 'sklearn' and CompiledForest.exists(compiled_path):
+            try:
+                if version is None:
+                    fingerprint = file_fingerprint([compiled_path])
+                else:
+                    model_registry.verify(version, [model_registry.COMPILED_MODEL])
+                    fingerprint = model_registry.read_metadata(version)['fingerprint']
+                forest = CompiledForest.load(compiled_path)
+                print(f"Compiled model loaded successfully ({version or 'unversioned'})")
+                return LoadedModel(forest, forest.classes_, 'compiled', fingerprint,
+                                   version or f'unversioned-{fingerprint[:8]}')
+            except Exception as e:
+                print(f"Error loading compiled model: {e}")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"No trained model found for {version or 'the unversioned files'}; "
+                "run python train_model.py")
+        if self.backend == 'compiled':
+            print("No usable compiled model found. Falling back to sklearn model...")
+        import joblib
+        if version is None:
+            fingerprint = file_fingerprint([model_path, encoder_path])
+        else:
+            model_registry.verify(version, [model_registry.SKLEARN_MODEL,
+                                            model_registry.LABEL_ENCODER])
+            fingerprint = model_registry.read_metadata(version)['fingerprint']
+        model = joblib.load(model_path)
+        label_encoder = joblib.load(encoder_path)
+        print(f"Model loaded successfully ({version or 'unversioned'})")
+        return LoadedModel(model, label_encoder.inverse_transform(model.classes_), 'sklearn',
+                           fingerprint, version or f'unversioned-{fingerprint[:8]}',
+                           label_encoder)
+    
+    def _activate(self, loaded):
+        if self.loaded is None or loaded.fingerprint != self.loaded.fingerprint:
+            # Cached results from another model can never be hit again
+            prediction_cache.clear()
+        self.loaded = loaded
     
     def load_model(self):
-        """Load pre-trained model"""
+        """Load the current registry version, or the unversioned files if
+        nothing has been published. Never trains: a missing or corrupt
+        model raises, and readiness stays false until one is available."""
         try:
-            if os.path.exists('health_risk_model.pkl'):
-                self.model = joblib.load('health_risk_model.pkl')
-                self.label_encoder = joblib.load('label_encoder.pkl')
-                self.is_trained = True
-                print("Model loaded successfully")
-            else:
-                print("No pre-trained model found. Training new model...")
-                self.train_model()
+            self._activate(self._load(model_registry.current_version()))
         except Exception as e:
             print(f"Error loading model: {e}")
-            self.train_model()
+            raise
     
+    def ensure_loaded(self):
+        """The loaded model, loading it once even if several threads ask at
+        the same time. Also starts a background switch-over when another
+        version has been made current."""
+        loaded = self.loaded
+        if loaded is None:
+            with self._load_lock:
+                if self.loaded is None:
+                    self.load_model()
+            return self.loaded
+        self._check_for_new_version(loaded)
+        return loaded
+    
+    def snapshot(self):
+        """The model to score and tag predictions with, or None if no model
+        can be loaded (analyses then fall back to 'unknown')"""
+        try:
+            return self.ensure_loaded()
+        except Exception:
+            return None
+    
+    def _check_for_new_version(self, loaded):
+        now = time.monotonic()
+        if now < self._next_reload_check:
+            return
+        self._next_reload_check = now + RELOAD_CHECK_SECONDS
+        version = model_registry.current_version()
+        if version is None or version in (loaded.version, self._failed_version):
+            return
+        with self._load_lock:
+            if self._reload_thread is None or not self._reload_thread.is_alive():
+                self._reload_thread = threading.Thread(
+                    target=self._reload, args=(version,), name='model-reload', daemon=True)
+                self._reload_thread.start()
+    
+    def _reload(self, version):
+        """Load a new version off the request path and swap it in; requests
+        keep using the previous model until then"""
+        try:
+            self._activate(self._load(version))
+            print(f"Switched to model version {version}")
+        except Exception as e:
+            # Keep serving the previous version; retry only if CURRENT changes
+            self._failed_version = version
+            print(f"Error loading model version {version}: {e}")
+    
+    def warm_up(self):
+        """Start loading the model in a background thread"""
+        with self._load_lock:
+            if self.is_trained or (self._warmup_thread and self._warmup_thread.is_alive()):
+                return self._warmup_thread
+            self._warmup_thread = threading.Thread(
+                target=self.snapshot, name='model-warmup', daemon=True)
+            self._warmup_thread.start()
+            return self._warmup_thread
+    
+    def _feature_matrix(self, records):
+        """Build an (n_samples, n_features) float array from records.
+
+        Accepts a list of dicts, a DataFrame or a 2-D array already in
+        FEATURES order.
+        """
+        if hasattr(records, 'columns'):
+            # pandas DataFrame; checked by duck typing to keep pandas optional
+            return records[FEATURES].to_numpy(dtype=np.float64)
+        if isinstance(records, np.ndarray):
+            features = np.asarray(records, dtype=np.float64)
+            if features.ndim == 1:
+                features = features.reshape(1, -1)
+            return features
+        return np.array([[record[name] for name in FEATURES] for record in records],
+                        dtype=np.float64).reshape(-1, len(FEATURES))
+
+    def predict_batch(self, records, loaded=None):
+        """Predict health risk for many records with a single model pass.
+
+        Uses `loaded` (a LoadedModel) if given, else the current model.
+        Returns a list of (risk_level, confidence) tuples in input order.
+        """
+        loaded = loaded or self.ensure_loaded()
+
+        features = self._feature_matrix(records)
+        if len(features) == 0:
+            return []
+
+        # One predict_proba pass; the label is the most probable class,
+        # which is exactly what RandomForestClassifier.predict returns
+        start = time.perf_counter()
+        probabilities = loaded.model.predict_proba(features)
+        metrics.observe_inference(loaded.backend, len(features), time.perf_counter() - start)
+        best = np.argmax(probabilities, axis=1)
+        risk_levels = loaded.classes[best]
+        confidences = probabilities[np.arange(len(best)), best]
+
+        return [(str(risk), float(conf)) for risk, conf in zip(risk_levels, confidences)]
+
     def predict_risk(self, health_data):
         """Predict health risk based on input data"""
-        if not self.is_trained:
-            self.load_model()
-        
         try:
-            # Prepare input features
-            features = np.array([[
-                health_data['age'],
-                health_data['weight'],
-                health_data['systolic_bp'],
-                health_data['diastolic_bp'],
-                health_data['heart_rate'],
-                health_data['blood_sugar'],
-                health_data['cholesterol'],
-                health_data['sleep_hours']
-            ]])
-            
-            # Make prediction
-            prediction = self.model.predict(features)[0]
-            probability = self.model.predict_proba(features)[0]
-            
-            risk_level = self.label_encoder.inverse_transform([prediction])[0]
-            confidence = np.max(probability)
-            
-            return risk_level, confidence
-            
+            return self.predict_batch([health_data])[0]
         except Exception as e:
             print(f"Error making prediction: {e}")
             return "unknown", 0.0
 
+    def analyze_batch(self, records, loaded=None):
+        """Risk, confidence, recommendations and conditions for many readings.
+        
+        The model's risk and confidence are looked up in the prediction
+        cache under the normalized features; only the misses go through the
+        model (`loaded`, or the current one), in a single batch. Rounding
+        only keys the cache: recommendations and conditions are evaluated on
+        the readings as submitted, so a value just past a threshold is never
+        rounded back below it. Returns a list of (risk_level, confidence,
+        recommendations, conditions) tuples in input order.
+        """
+        loaded = loaded or self.ensure_loaded()
+        normalized = [normalize_features(record) for record in records]
+        keys = [(loaded.fingerprint, tuple(record[name] for name in FEATURES))
+                for record in normalized]
+        predictions = [prediction_cache.get(key) for key in keys]
+        
+        missing = [i for i, prediction in enumerate(predictions) if prediction is None]
+        if missing:
+            computed = self.predict_batch([normalized[i] for i in missing], loaded)
+            for i, prediction in zip(missing, computed):
+                predictions[i] = prediction
+                prediction_cache.set(keys[i], prediction)
+        
+        risk_levels = [risk_level for risk_level, _ in predictions]
+        recommendations, conditions = get_rule_engine().analyze(risk_levels, records)
+        return [(risk_level, confidence, recommendations[i], conditions[i])
+                for i, (risk_level, confidence) in enumerate(predictions)]
+    
+    def analyze(self, health_data, loaded=None):
+        """Cached risk, confidence, recommendations and conditions for one reading"""
+        try:
+            return self.analyze_batch([health_data], loaded)[0]
+        except Exception as e:
+            print(f"Error making prediction: {e}")
+            return "unknown", 0.0, get_health_recommendations("unknown", health_data), \
+                get_predicted_conditions("unknown", health_data)
+
 # Global model instance
 health_predictor = HealthRiskPredictor()
 
@@ -141,89 +511,22 @@ def predict_health_risk(health_data):
     """Main function to predict health risk"""
     return health_predictor.predict_risk(health_data)
 
+def predict_health_risk_batch(records):
+    """Predict health risk for a batch of records"""
+    return health_predictor.predict_batch(records)
+
+def analyze_health(health_data, loaded=None):
+    """Predict risk and derive recommendations and conditions, using the cache"""
+    return health_predictor.analyze(health_data, loaded)
+
+def analyze_health_batch(records, loaded=None):
+    """Cached analysis for a batch of records"""
+    return health_predictor.analyze_batch(records, loaded)
+
 def get_health_recommendations(risk_level, health_data):
     """Generate health recommendations based on risk level and health data"""
-    recommendations = []
-    
-    # Blood pressure recommendations
-    if health_data['systolic_bp'] > 140 or health_data['diastolic_bp'] > 90:
-        recommendations.extend([
-            "Monitor blood pressure regularly",
-            "Reduce sodium intake",
-            "Consider consulting a doctor for hypertension management"
-        ])
-    
-    # Blood sugar recommendations
-    if health_data['blood_sugar'] > 180:
-        recommendations.extend([
-            "Monitor blood sugar levels",
-            "Reduce sugar and carbohydrate intake",
-            "Maintain regular meal times"
-        ])
-    
-    # Cholesterol recommendations
-    if health_data['cholesterol'] > 240:
-        recommendations.extend([
-            "Reduce saturated fat intake",
-            "Increase fiber consumption",
-            "Consider heart-healthy diet"
-        ])
-    
-    # Heart rate recommendations
-    if health_data['heart_rate'] > 100:
-        recommendations.append("Practice relaxation techniques to lower heart rate")
-    elif health_data['heart_rate'] < 60:
-        recommendations.append("Consult doctor about low heart rate")
-    
-    # Sleep recommendations
-    if health_data['sleep_hours'] < 6:
-        recommendations.extend([
-            "Aim for 7-8 hours of sleep per night",
-            "Maintain consistent sleep schedule",
-            "Create relaxing bedtime routine"
-        ])
-    
-    # General recommendations based on risk level
-    if risk_level == 'high':
-        recommendations.extend([
-            "Consult healthcare provider immediately",
-            "Regular monitoring of vital signs",
-            "Follow prescribed medications strictly"
-        ])
-    elif risk_level == 'medium':
-        recommendations.extend([
-            "Schedule doctor appointment soon",
-            "Increase physical activity gradually",
-            "Maintain healthy diet"
-        ])
-    else:
-        recommendations.extend([
-            "Continue healthy lifestyle habits",
-            "Regular health check-ups",
-            "Stay physically active"
-        ])
-    
-    return recommendations
+    return get_rule_engine().recommendations([risk_level], health_data)[0]
 
 def get_predicted_conditions(risk_level, health_data):
     """Predict potential health conditions based on risk factors"""
-    conditions = []
-    
-    if health_data['systolic_bp'] > 140 or health_data['diastolic_bp'] > 90:
-        conditions.append("Hypertension")
-    
-    if health_data['blood_sugar'] > 180:
-        conditions.append("Diabetes Risk")
-    
-    if health_data['cholesterol'] > 240:
-        conditions.append("High Cholesterol")
-    
-    if health_data['heart_rate'] > 100:
-        conditions.append("Tachycardia")
-    elif health_data['heart_rate'] < 60:
-        conditions.append("Bradycardia")
-    
-    if risk_level == 'high':
-        conditions.append("Cardiovascular Risk")
-    
-    return conditions if conditions else ["No specific conditions detected"]
\ No newline at end of file
+    return get_rule_engine().conditions([risk_level], health_data)[0]
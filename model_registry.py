@@ -0,0 +1,176 @@
+"""Versioned model artifacts with an atomically switched CURRENT pointer.
+
+Each trained model is published as its own directory under
+HEALTH_MODEL_REGISTRY (default model_versions/):
+
+    model_versions/
+        CURRENT                        name of the version workers serve
+        20261017T070000Z-3f9a1c2b/
+            health_risk_model.pkl
+            label_encoder.pkl
+            health_risk_model.forest/
+            metadata.json              creation time, training info, manifest
+
+Versions are written to a staging directory and renamed into place, and
+CURRENT is replaced with os.replace(), so a worker never sees a partial
+version or pointer. Published versions are never modified; rolling back
+is pointing CURRENT at an older version.
+
+publish() records each file's sha256, size and modification time in the
+metadata. verify() checks only the artifacts being loaded against that
+manifest and rehashes a file only when its size or modification time no
+longer match (e.g. after a copy that did not preserve them), so loading a
+version does not hash the whole directory every time.
+"""
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+
+REGISTRY_PATH = os.environ.get('HEALTH_MODEL_REGISTRY', 'model_versions')
+CURRENT_FILE = 'CURRENT'
+METADATA_FILE = 'metadata.json'
+
+# Artifact names inside a version directory
+SKLEARN_MODEL = 'health_risk_model.pkl'
+LABEL_ENCODER = 'label_encoder.pkl'
+COMPILED_MODEL = 'health_risk_model.forest'
+
+
+def version_path(version, registry=REGISTRY_PATH):
+    return os.path.join(registry, version)
+
+
+def current_version(registry=REGISTRY_PATH):
+    """Version named by CURRENT, or None if nothing has been published"""
+    try:
+        with open(os.path.join(registry, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_metadata(version, registry=REGISTRY_PATH):
+    with open(os.path.join(version_path(version, registry), METADATA_FILE)) as f:
+        return json.load(f)
+
+
+def list_versions(registry=REGISTRY_PATH):
+    """Metadata of every published version, oldest first"""
+    if not os.path.isdir(registry):
+        return []
+    versions = [name for name in os.listdir(registry)
+                if os.path.isfile(os.path.join(registry, name, METADATA_FILE))]
+    return sorted((read_metadata(version, registry) for version in versions),
+                  key=lambda metadata: metadata['created_at'])
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _files(root):
+    """Path of every file under root (except the metadata), keyed by path
+    relative to root"""
+    paths = {}
+    for directory, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            if relative != METADATA_FILE:
+                paths[relative] = path
+    return dict(sorted(paths.items()))
+
+
+def file_checksums(root):
+    """sha256 of every file under root, keyed by path relative to root"""
+    return {relative: _sha256(path) for relative, path in _files(root).items()}
+
+
+def file_manifest(root):
+    """Size and modification time of every file under root, keyed by path
+    relative to root"""
+    manifest = {}
+    for relative, path in _files(root).items():
+        stat = os.stat(path)
+        manifest[relative] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return manifest
+
+
+def verify(version, artifacts, registry=REGISTRY_PATH):
+    """Check the named artifacts (files or directories) of a version
+    against the manifest written by publish(); raises ValueError on a
+    mismatch"""
+    metadata = read_metadata(version, registry)
+    expected = metadata['checksums']
+    manifest = metadata.get('manifest', {})
+    root = version_path(version, registry)
+    for artifact in artifacts:
+        names = [name for name in expected if name == artifact or name.startswith(artifact + '/')]
+        if not names:
+            raise ValueError(f"Model version {version} has no {artifact}")
+        for name in names:
+            path = os.path.join(root, *name.split('/'))
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                raise ValueError(f"Missing {name} in model version {version}")
+            recorded = manifest.get(name)
+            if recorded is not None and stat.st_size == recorded['size'] \
+                    and stat.st_mtime_ns == recorded['mtime_ns']:
+                continue
+            if (recorded is not None and stat.st_size != recorded['size']) \
+                    or _sha256(path) != expected[name]:
+                raise ValueError(f"Checksum mismatch for {name} in model version {version}")
+
+
+def publish(write_artifacts, info=None, activate=True, registry=REGISTRY_PATH):
+    """Publish a new version and optionally make it current.
+
+    write_artifacts(directory) writes the model files into a staging
+    directory; info (e.g. accuracy, training rows) is stored in the
+    metadata. Returns the new version name.
+    """
+    os.makedirs(registry, exist_ok=True)
+    created_at = datetime.utcnow()
+    staging = os.path.join(registry, f'.staging-{os.getpid()}-{created_at:%Y%m%d%H%M%S%f}')
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    try:
+        write_artifacts(staging)
+        checksums = file_checksums(staging)
+        digest = hashlib.sha256(json.dumps(checksums).encode()).hexdigest()
+        version = f'{created_at:%Y%m%dT%H%M%SZ}-{digest[:8]}'
+        metadata = {
+            'version': version,
+            'created_at': created_at.isoformat() + 'Z',
+            'fingerprint': digest,
+            'checksums': checksums,
+            'manifest': file_manifest(staging),
+            **(info or {})
+        }
+        with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.rename(staging, version_path(version, registry))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if activate:
+        set_current(version, registry)
+    return version
+
+
+def set_current(version, registry=REGISTRY_PATH):
+    """Atomically point CURRENT at an already published version"""
+    if os.path.basename(version) != version or version.startswith('.') \
+            or not os.path.isfile(os.path.join(version_path(version, registry), METADATA_FILE)):
+        raise ValueError(f"Unknown model version: {version}")
+    staging = os.path.join(registry, f'.{CURRENT_FILE}.{os.getpid()}')
+    with open(staging, 'w') as f:
+        f.write(version + '\n')
+    os.replace(staging, os.path.join(registry, CURRENT_FILE))
@@ -1,29 +1,73 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+import math
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import password_hasher
 
 db = SQLAlchemy()
 
+# Numeric vitals accepted from forms and uploads, with their types
+VITAL_FIELDS = {
+    'weight': float,
+    'height': float,
+    'systolic_bp': int,
+    'diastolic_bp': int,
+    'heart_rate': int,
+    'blood_sugar': float,
+    'cholesterol': float,
+    'sleep_hours': float
+}
+TEXT_FIELDS = ['symptoms', 'medication', 'allergies', 'exercise_frequency']
+
+def parse_vital(name, value):
+    """A submitted vital as its column type; NaN and infinity are rejected
+    since SQLite would store NaN as NULL, and fractions of integer vitals
+    rather than truncated"""
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f'{name} must be a finite number')
+    if VITAL_FIELDS[name] is int and not value.is_integer():
+        raise ValueError(f'{name} must be a whole number')
+    return VITAL_FIELDS[name](value)
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    # Room for scrypt hashes, which are longer than 128 characters
+    password_hash = db.Column(db.String(256))
     age = db.Column(db.Integer)
     gender = db.Column(db.String(10))
     is_admin = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped whenever the user's health data changes; cached responses and
+    # ETags of the per-user read endpoints are keyed on it
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationship with health records
     health_records = db.relationship('HealthRecord', backref='user', lazy=True)
     predictions = db.relationship('Prediction', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify password, rehashing it with the configured method if the
+        stored hash is outdated (the caller commits)"""
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
+
+def bump_data_version(user_ids):
+    """Invalidate cached reads for these users as part of the current transaction"""
+    db.session.execute(
+        db.update(User)
+        .where(User.id.in_(set(user_ids)))
+        .values(data_version=User.data_version + 1)
+        .execution_options(synchronize_session=False)
+    )
 
 class HealthRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -48,6 +92,19 @@ class HealthRecord(db.Model):
     sleep_hours = db.Column(db.Float)
     
     recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Readings far from the user's own baseline when recorded, as
+    # 'metric=z,...' (see baselines.py)
+    anomalies = db.Column(db.String(200))
+    
+    # Per-user timelines (dashboard, history, trends) filter by user_id
+    # and order by recorded_at
+    __table_args__ = (
+        db.Index('ix_health_record_user_recorded', 'user_id', 'recorded_at'),
+        # Never reuse the id of a deleted (e.g. archived) record, which
+        # SQLite otherwise does for the highest ids
+        {'sqlite_autoincrement': True}
+    )
 
 class Prediction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -59,8 +116,195 @@ class Prediction(db.Model):
     predicted_conditions = db.Column(db.Text)
     confidence_score = db.Column(db.Float)
     recommendations = db.Column(db.Text)
+    # Registry version of the model that scored the record
+    model_version = db.Column(db.String(64))
     
     predicted_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationship with health record
-    health_record = db.relationship('HealthRecord', backref='prediction')
\ No newline at end of file
+    health_record = db.relationship('HealthRecord', backref='prediction')
+    
+    __table_args__ = (
+        db.Index('ix_prediction_user_predicted', 'user_id', 'predicted_at'),
+        # One prediction per record, so concurrent scorers cannot both store one
+        db.Index('uq_prediction_health_record', 'health_record_id', unique=True),
+    )
+
+class HealthRollup(db.Model):
+    """Per-user daily or weekly aggregates of vitals, kept up to date as
+    health records are added so trends never rescan raw records"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    period = db.Column(db.String(10), nullable=False)  # day, week
+    period_start = db.Column(db.Date, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    systolic_bp_sum = db.Column(db.Float)
+    systolic_bp_min = db.Column(db.Float)
+    systolic_bp_max = db.Column(db.Float)
+    diastolic_bp_sum = db.Column(db.Float)
+    diastolic_bp_min = db.Column(db.Float)
+    diastolic_bp_max = db.Column(db.Float)
+    heart_rate_sum = db.Column(db.Float)
+    heart_rate_min = db.Column(db.Float)
+    heart_rate_max = db.Column(db.Float)
+    blood_sugar_sum = db.Column(db.Float)
+    blood_sugar_min = db.Column(db.Float)
+    blood_sugar_max = db.Column(db.Float)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', 'period_start', name='uq_health_rollup_period'),
+    )
+    
+    METRICS = ('systolic_bp', 'diastolic_bp', 'heart_rate', 'blood_sugar')
+    
+    def mean(self, metric):
+        total = getattr(self, f'{metric}_sum')
+        return total / self.count if self.count and total is not None else None
+
+class HealthBaseline(db.Model):
+    """Running per-user statistics of each vital (Welford mean and sum of
+    squared deviations, plus a recent weighted average), updated in O(1)
+    per health record so anomalies are flagged without rescanning history"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    weight_mean = db.Column(db.Float)
+    weight_m2 = db.Column(db.Float)
+    weight_recent = db.Column(db.Float)
+    systolic_bp_mean = db.Column(db.Float)
+    systolic_bp_m2 = db.Column(db.Float)
+    systolic_bp_recent = db.Column(db.Float)
+    diastolic_bp_mean = db.Column(db.Float)
+    diastolic_bp_m2 = db.Column(db.Float)
+    diastolic_bp_recent = db.Column(db.Float)
+    heart_rate_mean = db.Column(db.Float)
+    heart_rate_m2 = db.Column(db.Float)
+    heart_rate_recent = db.Column(db.Float)
+    blood_sugar_mean = db.Column(db.Float)
+    blood_sugar_m2 = db.Column(db.Float)
+    blood_sugar_recent = db.Column(db.Float)
+    cholesterol_mean = db.Column(db.Float)
+    cholesterol_m2 = db.Column(db.Float)
+    cholesterol_recent = db.Column(db.Float)
+    sleep_hours_mean = db.Column(db.Float)
+    sleep_hours_m2 = db.Column(db.Float)
+    sleep_hours_recent = db.Column(db.Float)
+    
+    METRICS = ('weight', 'systolic_bp', 'diastolic_bp', 'heart_rate', 'blood_sugar',
+               'cholesterol', 'sleep_hours')
+
+def migrate_schema():
+    """Bring an existing database up to date with the models.
+
+    create_all() only creates missing tables, so columns and indexes added
+    to tables that already exist (e.g. an old instance/health_assistant.db)
+    are created here, and string columns whose length grew are widened.
+    New columns must be nullable or have a server_default. Safe to run
+    repeatedly; returns the names of what was created or widened.
+    """
+    inspector = db.inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        columns = {column['name']: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                add_column(table, column)
+                created.append(f'{table.name}.{column.name}')
+            elif is_narrower(columns[column.name]['type'], column.type) \
+                    and db.engine.dialect.name != 'sqlite':
+                # SQLite does not enforce string lengths
+                widen_column(table, column)
+                created.append(f'{table.name}.{column.name} ({column.type})')
+        
+        if db.engine.dialect.name == 'sqlite' and table.dialect_options['sqlite']['autoincrement'] \
+                and not has_sqlite_autoincrement(table):
+            rebuild_sqlite_table(table)
+            created.append(f'{table.name} (AUTOINCREMENT)')
+        
+        existing = {index['name'] for index in db.inspect(db.engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                if index.name in BEFORE_INDEX:
+                    BEFORE_INDEX[index.name]()
+                index.create(db.engine)
+                created.append(index.name)
+    
+    if created and db.engine.dialect.name == 'sqlite':
+        # Refresh planner statistics so the new indexes are used
+        with db.engine.begin() as connection:
+            connection.execute(db.text('ANALYZE'))
+    return created
+
+def delete_duplicate_predictions():
+    """Keep only the newest prediction of each health record"""
+    with db.engine.begin() as connection:
+        connection.execute(db.text(
+            'DELETE FROM prediction WHERE health_record_id IS NOT NULL AND id NOT IN '
+            '(SELECT max(id) FROM prediction WHERE health_record_id IS NOT NULL '
+            'GROUP BY health_record_id)'
+        ))
+
+# Clean-ups that must run before a unique index can be created on an
+# existing table
+BEFORE_INDEX = {
+    'uq_prediction_health_record': delete_duplicate_predictions
+}
+
+def has_sqlite_autoincrement(table):
+    """Whether a SQLite table was created with AUTOINCREMENT"""
+    with db.engine.connect() as connection:
+        sql = connection.execute(db.text('SELECT sql FROM sqlite_master WHERE type = :type '
+                                         'AND name = :name'),
+                                 {'type': 'table', 'name': table.name}).scalar()
+    return 'AUTOINCREMENT' in (sql or '').upper()
+
+def rebuild_sqlite_table(table):
+    """Recreate a SQLite table from its model (SQLite cannot add
+    AUTOINCREMENT in place), keeping every row and id. The copy seeds
+    sqlite_sequence with the highest id; indexes are recreated afterwards
+    by migrate_schema."""
+    preparer = db.engine.dialect.identifier_preparer
+    metadata = db.MetaData()
+    for key in table.foreign_keys:
+        # Referenced tables must be known for the FOREIGN KEY clauses
+        key.column.table.to_metadata(metadata)
+    staging = table.to_metadata(metadata, name=f'{table.name}_rebuild')
+    columns = ', '.join(preparer.format_column(column) for column in table.columns)
+    with db.engine.begin() as connection:
+        connection.execute(db.schema.CreateTable(staging))
+        connection.execute(db.text(
+            f'INSERT INTO {preparer.format_table(staging)} ({columns}) '
+            f'SELECT {columns} FROM {preparer.format_table(table)}'
+        ))
+        connection.execute(db.text(f'DROP TABLE {preparer.format_table(table)}'))
+        connection.execute(db.text(f'ALTER TABLE {preparer.format_table(staging)} '
+                                   f'RENAME TO {preparer.format_table(table)}'))
+
+def add_column(table, column):
+    """ALTER TABLE ... ADD COLUMN for a column defined on the model"""
+    preparer = db.engine.dialect.identifier_preparer
+    ddl = (f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN '
+           f'{preparer.format_column(column)} {column.type.compile(db.engine.dialect)}')
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        ddl += ' NOT NULL'
+    with db.engine.begin() as connection:
+        connection.execute(db.text(ddl))
+
+def is_narrower(existing_type, model_type):
+    """Whether a database string column is shorter than the model's"""
+    existing_length = getattr(existing_type, 'length', None)
+    model_length = getattr(model_type, 'length', None)
+    return existing_length is not None and model_length is not None \
+        and existing_length < model_length
+
+def widen_column(table, column):
+    """ALTER COLUMN ... TYPE to the model's (longer) string type"""
+    preparer = db.engine.dialect.identifier_preparer
+    ddl = (f'ALTER TABLE {preparer.format_table(table)} ALTER COLUMN '
+           f'{preparer.format_column(column)} TYPE {column.type.compile(db.engine.dialect)}')
+    with db.engine.begin() as connection:
+        connection.execute(db.text(ddl))
@@ -0,0 +1,95 @@
+"""Keyset (cursor) pagination for SQLAlchemy queries.
+
+Pages are selected with a row-value comparison on the sort columns, e.g.
+(recorded_at, id) < (:ts, :id), so every page costs one index range scan
+no matter how deep it is, and no COUNT(*) is needed to render it.
+"""
+from datetime import datetime
+from sqlalchemy import tuple_
+
+
+class KeysetPage:
+    """One page of results plus cursors for the neighbouring pages"""
+
+    def __init__(self, items, columns, has_next, has_prev):
+        self.items = items
+        self.has_next = has_next and bool(items)
+        self.has_prev = has_prev and bool(items)
+        self.next_cursor = encode_cursor(_values(items[-1], columns)) if self.has_next else None
+        self.prev_cursor = encode_cursor(_values(items[0], columns)) if self.has_prev else None
+
+
+def _values(item, columns):
+    return [getattr(item, column.key) for column in columns]
+
+
+def encode_cursor(values):
+    """Serialize sort key values as 'v1|v2' (datetimes in ISO format)"""
+    return '|'.join(value.isoformat() if isinstance(value, datetime) else str(value)
+                    for value in values)
+
+
+def decode_cursor(cursor, columns):
+    """Parse a cursor back into typed values; raises ValueError if malformed"""
+    parts = cursor.split('|')
+    if len(parts) != len(columns):
+        raise ValueError('Invalid cursor')
+    values = []
+    for part, column in zip(parts, columns):
+        python_type = column.type.python_type
+        values.append(datetime.fromisoformat(part) if python_type is datetime else python_type(part))
+    return values
+
+
+def _merge(rows, more, columns, reverse):
+    """Sorted union of two result lists, dropping items with a repeated key"""
+    merged = []
+    for item in sorted(rows + more, key=lambda item: _values(item, columns), reverse=reverse):
+        if not merged or _values(merged[-1], columns) != _values(item, columns):
+            merged.append(item)
+    return merged
+
+
+def keyset_paginate(query, columns, per_page, after=None, before=None, descending=True,
+                    extra=None):
+    """Return the KeysetPage of `query` ordered by `columns`.
+
+    `after` selects the page following a cursor and `before` the page
+    preceding one; with neither, the first page is returned. `columns`
+    must end with a unique column (e.g. the primary key) so the order is
+    total.
+
+    `extra(values, greater, limit)` supplies items stored outside the
+    query (e.g. archived records): up to `limit` items whose sort key is
+    greater (or less) than the cursor values (None for no bound), nearest
+    first. They are merged into the page by sort key.
+    """
+    key = tuple_(*columns)
+    values = None
+    backwards = before is not None
+    if backwards:
+        values = decode_cursor(before, columns)
+        condition = key > tuple_(*values) if descending else key < tuple_(*values)
+        # Walk towards the start, then flip the page back into display order
+        order = [column.asc() if descending else column.desc() for column in columns]
+    else:
+        order = [column.desc() if descending else column.asc() for column in columns]
+        condition = None
+        if after is not None:
+            values = decode_cursor(after, columns)
+            condition = key < tuple_(*values) if descending else key > tuple_(*values)
+
+    if condition is not None:
+        query = query.filter(condition)
+    rows = query.order_by(None).order_by(*order).limit(per_page + 1).all()
+    if extra is not None:
+        greater = backwards == descending
+        rows = _merge(rows, extra(values, greater, per_page + 1), columns,
+                      reverse=not greater)[:per_page + 1]
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if backwards:
+        rows.reverse()
+        return KeysetPage(rows, columns, has_next=True, has_prev=has_more)
+    return KeysetPage(rows, columns, has_next=has_more, has_prev=after is not None)
@@ -0,0 +1,102 @@
+"""Password hashing with a configurable method and bounded concurrency.
+
+Hashes use PASSWORD_HASH_METHOD (any werkzeug method string, e.g.
+'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'). Hashes stored with other
+parameters still verify and are upgraded the next time the user logs in,
+so the work factor can be changed without resetting passwords.
+
+Hashes run on the calling request thread, at most PASSWORD_HASH_THREADS
+at a time per process; further callers wait up to PASSWORD_HASH_WAIT_MS
+and then get PasswordHasherBusy instead of piling up. Both hashlib.scrypt
+and pbkdf2_hmac release the GIL, so under threaded workers the limit caps
+how many cores a burst of logins can take while other requests keep being
+served. A sync worker hashes one request at a time anyway, so there the
+limit never applies; login throughput then comes from the number of
+workers and the hash cost.
+"""
+import os
+import secrets
+import threading
+from functools import lru_cache
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = 'scrypt'
+THREADS = int(os.environ.get('PASSWORD_HASH_THREADS', str(os.cpu_count() or 1)))
+WAIT = int(os.environ.get('PASSWORD_HASH_WAIT_MS', '5000')) / 1000
+
+
+class PasswordHasherBusy(Exception):
+    """Too many hashes are already running"""
+
+
+@lru_cache(maxsize=None)
+def reference_hash(method):
+    """Hash of a random password with `method`, with werkzeug's defaults filled in.
+
+    Its prefix is the full method string new hashes get, and it stands in
+    for the stored hash of unknown users so failed logins cost the same.
+    """
+    return generate_password_hash(secrets.token_hex(16), method)
+
+
+def hash_method(pwhash):
+    """Method and parameters a stored hash was made with"""
+    return pwhash.split('$', 1)[0]
+
+
+class PasswordHasher:
+    """Runs password hashing, at most `threads` hashes at a time"""
+
+    def __init__(self, threads=THREADS, wait=WAIT):
+        self.threads = threads
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(threads)
+        self.hashed = 0
+        self.verified = 0
+        self.rejected = 0
+
+    @property
+    def method(self):
+        if has_app_context():
+            return current_app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD)
+        return DEFAULT_METHOD
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.wait):
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        try:
+            return fn(*args)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        self.hashed += 1
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """Check password against a stored hash; None (no such user) is
+        checked against a dummy hash and never matches"""
+        self.verified += 1
+        if not pwhash:
+            self._run(check_password_hash, reference_hash(self.method), password)
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Whether pwhash was made with a different method or work factor"""
+        return hash_method(pwhash) != hash_method(reference_hash(self.method))
+
+    def stats(self):
+        """Counters for monitoring"""
+        return {
+            'method': hash_method(reference_hash(self.method)),
+            'threads': self.threads,
+            'hashed': self.hashed,
+            'verified': self.verified,
+            'rejected': self.rejected
+        }
+
+
+password_hasher = PasswordHasher()
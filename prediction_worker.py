@@ -0,0 +1,222 @@
+"""Background prediction worker used when PREDICTION_MODE=async.
+
+In async mode /input-health only stores the health record and hands its id
+to this worker, so the request returns without waiting for the model. A
+single thread per process drains the queue in micro-batches (up to
+PREDICTION_BATCH_SIZE records, or whatever arrived within
+PREDICTION_BATCH_WAIT_MS of the first one) and scores each batch with one
+model call. A batch that fails is retried with exponential backoff, up to
+PREDICTION_MAX_ATTEMPTS times.
+
+The queue lives in memory; the database is the source of truth, so records
+recorded within the last PREDICTION_RECOVERY_HOURS that were left without
+a prediction by a restart are picked up again, a page at a time whenever
+the queue is idle. Older records without one (e.g. bulk imports made
+without --predict) are left alone. Predictions are inserted with ON
+CONFLICT DO NOTHING against the unique index on health_record_id, so
+workers in several processes recovering the same records never store a
+record twice.
+"""
+import heapq
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from models import db, User, HealthRecord, Prediction, bump_data_version
+from database import upsert_insert
+from ml_model import FEATURES, analyze_health_batch, health_predictor
+
+BATCH_SIZE = int(os.environ.get('PREDICTION_BATCH_SIZE', '64'))
+BATCH_WAIT = int(os.environ.get('PREDICTION_BATCH_WAIT_MS', '50')) / 1000
+RECOVERY_HOURS = float(os.environ.get('PREDICTION_RECOVERY_HOURS', '24'))
+MAX_ATTEMPTS = int(os.environ.get('PREDICTION_MAX_ATTEMPTS', '5'))
+# Delay before the first retry of a failed batch; doubled on each attempt
+RETRY_DELAY = float(os.environ.get('PREDICTION_RETRY_DELAY_S', '1'))
+
+
+def pending_record_ids(after_id=0, since=None, limit=BATCH_SIZE):
+    """Up to `limit` ids of health records without a prediction, after
+    `after_id` in id order, optionally only those recorded since `since`"""
+    query = db.session.query(HealthRecord.id)\
+        .outerjoin(Prediction, Prediction.health_record_id == HealthRecord.id)\
+        .filter(Prediction.id.is_(None), HealthRecord.id > after_id)
+    if since is not None:
+        query = query.filter(HealthRecord.recorded_at >= since)
+    return [record_id for (record_id,) in query.order_by(HealthRecord.id).limit(limit)]
+
+
+def predict_records(record_ids):
+    """Score the records among record_ids that are still pending and store
+    their predictions in one transaction; returns how many were stored"""
+    rows = db.session.query(HealthRecord, User.age)\
+        .join(User, User.id == HealthRecord.user_id)\
+        .outerjoin(Prediction, Prediction.health_record_id == HealthRecord.id)\
+        .filter(HealthRecord.id.in_(record_ids), Prediction.id.is_(None))\
+        .all()
+    if not rows:
+        return 0
+
+    records = [
+        {**{name: getattr(record, name) for name in FEATURES if name != 'age'}, 'age': age}
+        for record, age in rows
+    ]
+    model = health_predictor.ensure_loaded()
+    predictions = []
+    for (record, _), result in zip(rows, analyze_health_batch(records, model)):
+        risk_level, confidence, recommendations, predicted_conditions = result
+        predictions.append({
+            'user_id': record.user_id,
+            'health_record_id': record.id,
+            'risk_level': risk_level,
+            'predicted_conditions': ', '.join(predicted_conditions),
+            'confidence_score': confidence,
+            'recommendations': '; '.join(recommendations),
+            'model_version': model.version
+        })
+    # Another process may have scored some of them since they were read
+    stored = db.session.execute(
+        upsert_insert(db.session.get_bind().dialect, Prediction.__table__)
+        .on_conflict_do_nothing(index_elements=['health_record_id']),
+        predictions
+    ).rowcount
+    bump_data_version(record.user_id for record, _ in rows)
+    db.session.commit()
+    return stored if stored >= 0 else len(rows)
+
+
+class PredictionWorker:
+    """Queue of health record ids scored in micro-batches by a daemon thread"""
+
+    def __init__(self, batch_size=BATCH_SIZE, max_wait=BATCH_WAIT,
+                 recovery_hours=RECOVERY_HOURS, max_attempts=MAX_ATTEMPTS,
+                 retry_delay=RETRY_DELAY):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.recovery_hours = recovery_hours
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.app = None
+        self._queue = queue.Queue()
+        self._retries = []  # heap of (due, attempt, ids)
+        # Last id recovered so far, or None once recovery is done
+        self._recover_after = None
+        self._recover_since = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.batches = 0
+        self.recovered = 0
+        self.retried = 0
+        self.failed = 0
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['prediction_worker'] = self
+
+    def start(self):
+        """Start the worker thread (once per process)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self.recovery_hours > 0:
+                    self._recover_since = datetime.utcnow() - timedelta(hours=self.recovery_hours)
+                    self._recover_after = 0
+                self._thread = threading.Thread(target=self._run, name='prediction-worker',
+                                                daemon=True)
+                self._thread.start()
+
+    def enqueue(self, record_ids):
+        for record_id in record_ids:
+            self._queue.put(record_id)
+
+    def _recover_page(self):
+        """The next page of records left pending by a restart"""
+        try:
+            with self.app.app_context():
+                ids = pending_record_ids(self._recover_after, self._recover_since,
+                                         self.batch_size)
+        except Exception as e:
+            print(f"Error finding health records awaiting prediction: {e}")
+            ids = []
+        if ids:
+            self._recover_after = ids[-1]
+            self.recovered += len(ids)
+        else:
+            self._recover_after = None
+            if self.recovered:
+                print(f"Recovered {self.recovered} health records awaiting prediction")
+        return ids
+
+    def _next_batch(self):
+        """The next (ids, attempt) to score: a retry that is due, else ids
+        from the queue (blocking for one, then collecting more until the
+        batch is full or max_wait has passed), else a page of recovered
+        records"""
+        while True:
+            if self._retries and self._retries[0][0] <= time.monotonic():
+                _, attempt, batch = heapq.heappop(self._retries)
+                return batch, attempt
+            if self._recover_after is not None and self._queue.empty():
+                batch = self._recover_page()
+                if batch:
+                    return batch, 0
+                continue
+            timeout = max(self._retries[0][0] - time.monotonic(), 0) if self._retries else None
+            try:
+                batch = [self._queue.get(timeout=timeout)]
+                break
+            except queue.Empty:
+                continue
+
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch, 0
+
+    def _retry_later(self, batch, attempt, error):
+        attempt += 1
+        if attempt >= self.max_attempts:
+            # The records stay pending in the database and are recovered
+            # if the worker restarts within the recovery window
+            self.failed += len(batch)
+            print(f"Error predicting health records {batch[0]}..{batch[-1]}, "
+                  f"giving up after {attempt} attempts: {error}")
+            return
+        delay = self.retry_delay * 2 ** (attempt - 1)
+        self.retried += len(batch)
+        print(f"Error predicting health records {batch[0]}..{batch[-1]}, "
+              f"retrying in {delay:g}s: {error}")
+        heapq.heappush(self._retries, (time.monotonic() + delay, attempt, batch))
+
+    def _run(self):
+        while True:
+            batch, attempt = self._next_batch()
+            try:
+                with self.app.app_context():
+                    self.processed += predict_records(batch)
+                self.batches += 1
+            except Exception as e:
+                self._retry_later(batch, attempt, e)
+
+    def stats(self):
+        """Counters for monitoring"""
+        return {
+            'queued': self._queue.qsize(),
+            'retrying': sum(len(batch) for _, _, batch in list(self._retries)),
+            'processed': self.processed,
+            'batches': self.batches,
+            'recovered': self.recovered,
+            'retried': self.retried,
+            'failed': self.failed,
+            'batch_size': self.batch_size,
+            'max_wait_ms': self.max_wait * 1000
+        }
+
+
+prediction_worker = PredictionWorker()
@@ -0,0 +1,113 @@
+"""Conditional GET and server-side caching for per-user JSON endpoints.
+
+Views decorated with @versioned_json are cached under the logged-in user's
+data_version, which is bumped in the same transaction as every write to
+their health data. A repeat request for unchanged data is answered from the
+cache, and a client that sends the ETag it already has back in
+If-None-Match gets an empty 304 instead of the payload. cached_fragment()
+keeps rendered HTML fragments (e.g. the per-user dashboard cards) in the
+same backend under a key that holds the data version.
+
+The default backend is an in-process LRU; set RESPONSE_CACHE to
+'module:Class' to use any object with get(key) and set(key, value) (e.g. a
+shared store for multi-worker deployments) or to 'none' to disable it.
+"""
+import hashlib
+import importlib
+from datetime import datetime
+from functools import wraps
+from flask import current_app, request, make_response
+from markupsafe import Markup
+from flask_login import current_user
+from ttl_cache import TTLCache
+
+
+class NullBackend:
+    """Backend that stores nothing; every request is rendered"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def stats(self):
+        return {'size': 0, 'max_size': 0}
+
+
+def create_backend(spec, max_size=1024, ttl=3600):
+    """Instantiate the backend named by RESPONSE_CACHE"""
+    if spec == 'memory':
+        return TTLCache(max_size=max_size, ttl=ttl)
+    if spec == 'none':
+        return NullBackend()
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def init_app(app):
+    app.extensions['response_cache'] = create_backend(
+        app.config['RESPONSE_CACHE'],
+        max_size=app.config['RESPONSE_CACHE_SIZE'],
+        ttl=app.config['RESPONSE_CACHE_TTL']
+    )
+
+
+def get_backend():
+    return current_app.extensions['response_cache']
+
+
+def stats():
+    """The backend's stats(), or None for custom backends without one"""
+    backend = get_backend()
+    return backend.stats() if hasattr(backend, 'stats') else None
+
+
+def cached_fragment(key, render):
+    """HTML for key from the cache, rendered with render() on a miss.
+
+    The key must change whenever the output would, e.g. by holding the
+    user's data_version and the locale.
+    """
+    backend = get_backend()
+    key = ('fragment',) + tuple(key)
+    html = backend.get(key)
+    if html is None:
+        html = render()
+        backend.set(key, html)
+    return Markup(html)
+
+
+def versioned_json(view):
+    """Cache a login-only JSON view per user data version and serve ETags.
+
+    The key also holds the query string and today's date, since trend
+    windows are relative to now. ETags are a hash of the exact body, so
+    they are strong validators.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.endpoint, current_user.id, current_user.data_version,
+               datetime.utcnow().date().isoformat(),
+               tuple(sorted(request.args.items(multi=True))))
+        backend = get_backend()
+        entry = backend.get(key)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            entry = (hashlib.sha256(body).hexdigest()[:32], body)
+            backend.set(key, entry)
+
+        etag, body = entry
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        # Browsers may keep the payload but must revalidate it every time
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+        return response
+    return wrapper
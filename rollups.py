@@ -0,0 +1,127 @@
+"""Incrementally maintained daily and weekly vitals rollups.
+
+update_rollups() folds newly added health records into the per-user
+HealthRollup rows inside the caller's transaction, and rebuild_rollups()
+recomputes them from scratch (e.g. for databases created before rollups
+existed).
+
+Rollups are written with INSERT ... ON CONFLICT DO UPDATE, adding to the
+stored count and sums in SQL rather than writing back values read
+earlier, so concurrent writers never lose each other's readings and two
+first readings of a period never collide on uq_health_rollup_period.
+"""
+from datetime import datetime, timedelta
+from models import db, HealthRecord, HealthRollup
+from database import upsert_insert
+import archive
+
+
+def period_start(timestamp, period):
+    """First day of the period containing timestamp (weeks start on Monday)"""
+    day = timestamp.date() if isinstance(timestamp, datetime) else timestamp
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def _record_totals(record):
+    """Aggregate columns for a single record"""
+    totals = {'count': 1}
+    for metric in HealthRollup.METRICS:
+        value = getattr(record, metric)
+        totals[f'{metric}_sum'] = 0.0 if value is None else float(value)
+        totals[f'{metric}_min'] = totals[f'{metric}_max'] = value
+    return totals
+
+
+def _merge(totals, other):
+    """Fold the aggregate columns of `other` into `totals` in place"""
+    totals['count'] += other['count']
+    for metric in HealthRollup.METRICS:
+        totals[f'{metric}_sum'] += other[f'{metric}_sum'] or 0.0
+        for name, pick in ((f'{metric}_min', min), (f'{metric}_max', max)):
+            if other[name] is not None:
+                totals[name] = other[name] if totals[name] is None else pick(totals[name], other[name])
+
+
+def _upsert_statement():
+    """INSERT of rollup rows that adds to an existing row for the same
+    (user, period, period start) instead of failing"""
+    insert = upsert_insert(db.session.get_bind().dialect, HealthRollup)
+    new = insert.excluded
+    values = {'count': HealthRollup.count + new['count']}
+    for metric in HealthRollup.METRICS:
+        total = f'{metric}_sum'
+        values[total] = db.func.coalesce(getattr(HealthRollup, total), 0.0) + \
+            db.func.coalesce(new[total], 0.0)
+        for name, smaller in ((f'{metric}_min', True), (f'{metric}_max', False)):
+            stored, added = getattr(HealthRollup, name), new[name]
+            values[name] = db.case(
+                (added.is_(None), stored),
+                (stored.is_(None), added),
+                ((added < stored) if smaller else (added > stored), added),
+                else_=stored
+            )
+    return insert.on_conflict_do_update(
+        index_elements=['user_id', 'period', 'period_start'], set_=values)
+
+
+def update_rollups(records):
+    """Add new health records to their day and week rollups.
+
+    Call after the records are flushed and before commit, so the rollups
+    are written in the same transaction as the records. Records only need
+    user_id, recorded_at and the metric attributes. The records are
+    aggregated in memory first, so each affected rollup is written once,
+    with a single bulk upsert.
+    """
+    groups = {}
+    for record in records:
+        key = (record.user_id, 'day', record.recorded_at.date())
+        if key in groups:
+            _merge(groups[key], _record_totals(record))
+        else:
+            groups[key] = _record_totals(record)
+    for (user_id, _, day), totals in list(groups.items()):
+        key = (user_id, 'week', period_start(day, 'week'))
+        if key in groups:
+            _merge(groups[key], totals)
+        else:
+            groups[key] = dict(totals)
+    if not groups:
+        return
+    
+    db.session.execute(_upsert_statement(), [
+        {'user_id': user_id, 'period': period, 'period_start': start, **totals}
+        for (user_id, period, start), totals in groups.items()
+    ])
+
+
+def rebuild_rollups(user_id=None, chunk_size=5000):
+    """Recompute rollups from the raw health records, live and archived;
+    returns records folded in"""
+    rollups = HealthRollup.query
+    records = HealthRecord.query
+    if user_id is not None:
+        rollups = rollups.filter_by(user_id=user_id)
+        records = records.filter_by(user_id=user_id)
+    rollups.delete(synchronize_session=False)
+    
+    # Walk records by id so each chunk is a cheap primary-key range scan
+    last_id = 0
+    total = 0
+    while True:
+        chunk = records.filter(HealthRecord.id > last_id)\
+            .order_by(HealthRecord.id).limit(chunk_size).all()
+        if not chunk:
+            break
+        update_rollups(chunk)
+        last_id = chunk[-1].id
+        # Keep the identity map small on large tables
+        db.session.expunge_all()
+        total += len(chunk)
+    for chunk in archive.iter_chunks(archive.iter_archived(user_id), chunk_size):
+        update_rollups(chunk)
+        total += len(chunk)
+    db.session.commit()
+    return total
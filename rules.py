@@ -0,0 +1,168 @@
+"""Declarative health rules compiled into a vectorized evaluator.
+
+The thresholds behind recommendations, predicted conditions and the
+synthetic training labels live in one rule table (health_rules.json by
+default, or HEALTH_RULES_PATH). Each rule is compiled into NumPy
+comparisons, so a single reading and a whole batch are scored the same
+way, and the table is reloaded when the file changes on disk.
+"""
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+
+RULES_PATH = os.environ.get('HEALTH_RULES_PATH', 'health_rules.json')
+
+OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal
+}
+
+
+class RuleEngine:
+    """Evaluates a rule table against one record or a batch of records"""
+
+    def __init__(self, config, version=None):
+        self.version = version
+        self.rules = config['rules']
+        if len(self.rules) > 62:
+            raise ValueError("At most 62 rules are supported")
+
+        self._compiled = []
+        features = set()
+        for rule in self.rules:
+            when = rule['when']
+            mode = 'any' if 'any' in when else 'all'
+            clauses = []
+            for feature, op, value in when[mode]:
+                if op not in OPERATORS:
+                    raise ValueError(f"Unknown operator {op!r} in rule {rule['id']}")
+                clauses.append((feature, OPERATORS[op], float(value)))
+                features.add(feature)
+            self._compiled.append((mode, clauses))
+        self.features = sorted(features)
+
+        self.risk_points = np.array([rule.get('risk_points', 0) for rule in self.rules])
+        self.rule_recommendations = [rule.get('recommendations', []) for rule in self.rules]
+        self.rule_conditions = [rule.get('condition') for rule in self.rules]
+        self.risk_levels_table = sorted(config['risk_levels'], key=lambda level: -level['min_score'])
+        self.risk_recommendations = config['risk_recommendations']
+        self.risk_conditions = config.get('risk_conditions', {})
+        self.no_conditions = config.get('no_conditions')
+
+        # Bit per rule, used to group rows that fired the same rules
+        self._bits = np.left_shift(1, np.arange(len(self.rules), dtype=np.int64))
+
+    @classmethod
+    def from_file(cls, path=RULES_PATH):
+        with open(path, 'rb') as f:
+            content = f.read()
+        return cls(json.loads(content), version=hashlib.sha256(content).hexdigest()[:16])
+
+    def _columns(self, data):
+        """Feature columns as float arrays from a dict, list of dicts or DataFrame"""
+        if hasattr(data, 'columns'):
+            return {name: data[name].to_numpy(dtype=np.float64) for name in self.features}
+        if isinstance(data, dict):
+            return {name: np.atleast_1d(np.asarray(data[name], dtype=np.float64))
+                    for name in self.features}
+        return {name: np.fromiter((record[name] for record in data), dtype=np.float64,
+                                  count=len(data))
+                for name in self.features}
+
+    def evaluate(self, data):
+        """Boolean matrix of shape (n_records, n_rules): which rules fired"""
+        columns = self._columns(data)
+        n_records = len(next(iter(columns.values()))) if columns else len(data)
+        fired = np.zeros((n_records, len(self.rules)), dtype=bool)
+        for index, (mode, clauses) in enumerate(self._compiled):
+            masks = [op(columns[feature], value) for feature, op, value in clauses]
+            reduce = np.logical_or.reduce if mode == 'any' else np.logical_and.reduce
+            fired[:, index] = reduce(masks)
+        return fired
+
+    def risk_scores(self, data):
+        return self.evaluate(data).astype(np.int64) @ self.risk_points
+
+    def risk_levels(self, data):
+        """Rule-based risk level per record (used to label training data)"""
+        scores = self.risk_scores(data)
+        return np.select(
+            [scores >= level['min_score'] for level in self.risk_levels_table],
+            [level['level'] for level in self.risk_levels_table],
+            default=self.risk_levels_table[-1]['level']
+        )
+
+    def _per_record(self, fired, risk_levels, build):
+        """Build one list per record, sharing work between identical patterns"""
+        codes = (fired.astype(np.int64) @ self._bits).tolist()
+        if isinstance(risk_levels, str):
+            risk_levels = [risk_levels] * len(codes)
+        built = {}
+        results = []
+        for code, risk_level in zip(codes, risk_levels):
+            key = (code, risk_level)
+            template = built.get(key)
+            if template is None:
+                rule_indexes = [i for i in range(len(self.rules)) if code >> i & 1]
+                template = built[key] = build(rule_indexes, risk_level)
+            results.append(template.copy())
+        return results
+
+    def _build_recommendations(self, rule_indexes, risk_level):
+        recommendations = []
+        for index in rule_indexes:
+            recommendations.extend(self.rule_recommendations[index])
+        recommendations.extend(self.risk_recommendations.get(
+            risk_level, self.risk_recommendations.get('default', [])))
+        return recommendations
+
+    def _build_conditions(self, rule_indexes, risk_level):
+        conditions = [self.rule_conditions[index] for index in rule_indexes
+                      if self.rule_conditions[index]]
+        conditions.extend(self.risk_conditions.get(risk_level, []))
+        if not conditions and self.no_conditions:
+            conditions.append(self.no_conditions)
+        return conditions
+
+    def recommendations(self, risk_levels, data):
+        """Recommendation list per record"""
+        return self._per_record(self.evaluate(data), risk_levels, self._build_recommendations)
+
+    def conditions(self, risk_levels, data):
+        """Predicted condition list per record"""
+        return self._per_record(self.evaluate(data), risk_levels, self._build_conditions)
+
+    def analyze(self, risk_levels, data):
+        """(recommendations, conditions) lists per record from a single evaluation"""
+        fired = self.evaluate(data)
+        return (self._per_record(fired, risk_levels, self._build_recommendations),
+                self._per_record(fired, risk_levels, self._build_conditions))
+
+
+_engine = None
+_engine_mtime = None
+_engine_lock = threading.Lock()
+
+
+def get_rule_engine():
+    """The rule engine for RULES_PATH, reloaded whenever the file changes"""
+    global _engine, _engine_mtime
+    mtime = os.stat(RULES_PATH).st_mtime_ns
+    if _engine is None or mtime != _engine_mtime:
+        with _engine_lock:
+            if _engine is None or mtime != _engine_mtime:
+                try:
+                    _engine = RuleEngine.from_file(RULES_PATH)
+                except (OSError, ValueError, KeyError) as e:
+                    # Keep serving the last good table if an edit is broken
+                    if _engine is None:
+                        raise
+                    print(f"Error reloading health rules: {e}")
+                _engine_mtime = mtime
+    return _engine
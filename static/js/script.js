@@ -221,13 +221,29 @@ function getBMICategory(bmi) {
 }
 
 // API functions
-async function fetchHealthTrends() {
+// Last trends payload and its ETag per URL, revalidated with If-None-Match
+const healthTrendsCache = {};
+
+async function fetchHealthTrends(params = {}) {
+    const query = new URLSearchParams(params).toString();
+    const url = '/api/health-trends' + (query ? '?' + query : '');
+    const cached = healthTrendsCache[url];
     try {
-        const response = await fetch('/api/health-trends');
-        return await response.json();
+        const response = await fetch(url, {
+            headers: cached ? { 'If-None-Match': cached.etag } : {}
+        });
+        if (response.status === 304 && cached) {
+            return cached.data;
+        }
+        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        if (response.ok && etag) {
+            healthTrendsCache[url] = { etag, data };
+        }
+        return data;
     } catch (error) {
         console.error('Error fetching health trends:', error);
-        return null;
+        return cached ? cached.data : null;
     }
 }
 
@@ -0,0 +1,94 @@
+"""The dashboard and history pages issue a fixed number of SQL statements,
+however many records a resident has, and the admin page however many
+residents there are."""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, User, HealthRecord, Prediction
+from rollups import update_rollups
+from baselines import update_baselines
+
+
+def make_client(tmp_path, size, as_admin=False):
+    """A client for `size` residents with `size` records each, logged in as
+    the first resident or as the default admin"""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'ARCHIVE_DIR': str(tmp_path / 'archive'),
+        'MODEL_WARMUP': 'lazy',
+        'RESPONSE_CACHE': 'none',
+        'TESTING': True,
+    })
+    with app.app_context():
+        users = [User(username=f'resident{n}', email=f'resident{n}@example.com', age=72,
+                      gender='female') for n in range(size)]
+        db.session.add_all(users)
+        db.session.flush()
+        start = datetime.utcnow() - timedelta(days=size)
+        health_records = [HealthRecord(
+            user_id=user.id, recorded_at=start + timedelta(days=i),
+            weight=70 + i % 5, height=165, systolic_bp=120 + i % 30, diastolic_bp=80,
+            heart_rate=70, blood_sugar=110, cholesterol=190, sleep_hours=7,
+            symptoms='', medication='', allergies='', exercise_frequency='weekly'
+        ) for user in users for i in range(size)]
+        update_baselines(health_records)
+        db.session.add_all(health_records)
+        db.session.flush()
+        update_rollups(health_records)
+        db.session.add_all(Prediction(
+            user_id=record.user_id, health_record_id=record.id, risk_level='medium',
+            predicted_conditions='Hypertension', confidence_score=0.8,
+            recommendations='Monitor blood pressure regularly'
+        ) for record in health_records)
+        db.session.commit()
+        if as_admin:
+            user_id = User.query.filter_by(is_admin=True).first().id
+        else:
+            user_id = users[0].id
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return app, client
+
+
+def count_statements(app, client, path):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize('path, as_admin', [
+    ('/dashboard', False),
+    ('/history', False),
+    ('/admin', True),
+])
+def test_statement_count_does_not_grow_with_data(tmp_path, path, as_admin):
+    counts = []
+    for size in (3, 40):
+        directory = tmp_path / str(size)
+        directory.mkdir()
+        app, client = make_client(directory, size, as_admin)
+        client.get(path)  # first request loads the user and fills caches
+        counts.append(count_statements(app, client, path))
+    assert counts[0] == counts[1], f'{path}: {counts[0]} statements for 3 residents and ' \
+                                   f'records, {counts[1]} for 40'
@@ -1,6 +1,85 @@
-from ml_model import health_predictor
+import argparse
+import model_registry
+from ml_model import health_predictor, load_training_data, SAMPLE_FEATURE_RANGES
+
+def parse_range(value):
+    """Parse FEATURE=LOW:HIGH into (feature, (low, high, kind))"""
+    try:
+        name, bounds = value.split('=')
+        low, high = bounds.split(':')
+        kind = SAMPLE_FEATURE_RANGES[name][2]
+        cast = int if kind == 'int' else float
+        return name, (cast(low), cast(high), kind)
+    except (KeyError, ValueError):
+        raise argparse.ArgumentTypeError(
+            f"expected FEATURE=LOW:HIGH with FEATURE one of {', '.join(SAMPLE_FEATURE_RANGES)}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the health risk prediction model")
+    parser.add_argument('--export-only', action='store_true',
+                        help="Don't train: publish the current (or unversioned) pickled model "
+                             "as a new version with a fresh compiled NumPy export")
+    parser.add_argument('--no-activate', action='store_true',
+                        help="Publish the new version without making it current")
+    parser.add_argument('--activate', metavar='VERSION',
+                        help="Only make an already published version current (e.g. to roll "
+                             "back); running workers switch to it in the background")
+    parser.add_argument('--list', action='store_true',
+                        help="List published model versions")
+    parser.add_argument('--input', metavar='CSV',
+                        help="Train on imported rows instead of generated data; rows without "
+                             "a risk_level column are labelled with the health rules")
+    parser.add_argument('--samples', type=int, default=1000,
+                        help="Number of synthetic rows to generate (default: 1000)")
+    parser.add_argument('--seed', type=int, default=42,
+                        help="Random seed for synthetic data (default: 42)")
+    parser.add_argument('--range', dest='ranges', type=parse_range, action='append', default=[],
+                        metavar='FEATURE=LOW:HIGH',
+                        help="Override the range of a generated feature; may be repeated")
+    parser.add_argument('--n-estimators', type=int, default=100,
+                        help="Number of trees in the forest (default: 100)")
+    parser.add_argument('--n-jobs', type=int, default=-1,
+                        help="Parallel jobs for fitting and scoring (default: -1, all cores)")
+    parser.add_argument('--chunk-size', type=int,
+                        help="Grow the forest with warm_start, fitting a share of the trees "
+                             "on each chunk of this many training rows")
+    parser.add_argument('--min-samples-leaf', type=int, default=1,
+                        help="Minimum rows per leaf; raise it for very large datasets to "
+                             "keep the model small (default: 1)")
+    return parser.parse_args()
+
+def list_versions():
+    current = model_registry.current_version()
+    for metadata in model_registry.list_versions():
+        marker = '*' if metadata['version'] == current else ' '
+        accuracy = metadata.get('accuracy')
+        details = f"accuracy {accuracy:.3f}" if accuracy is not None else \
+            f"exported from {metadata.get('exported_from')}"
+        print(f"{marker} {metadata['version']}  {metadata['created_at'][:19]}  {details}")
 
 if __name__ == "__main__":
-    print("Training health risk prediction model...")
-    health_predictor.train_model()
-    print("Model training completed!")
\ No newline at end of file
+    args = parse_args()
+    if args.list:
+        list_versions()
+    elif args.activate:
+        model_registry.set_current(args.activate)
+        print(f"Model version {args.activate} is now current")
+    elif args.export_only:
+        print("Exporting compiled model...")
+        health_predictor.backend = 'sklearn'
+        health_predictor.export_compiled(activate=not args.no_activate)
+        print("Model export completed!")
+    else:
+        print("Training health risk prediction model...")
+        health_predictor.train_model(
+            n_samples=args.samples,
+            seed=args.seed,
+            n_estimators=args.n_estimators,
+            n_jobs=args.n_jobs,
+            chunk_size=args.chunk_size,
+            feature_ranges=dict(args.ranges),
+            data=load_training_data(args.input) if args.input else None,
+            min_samples_leaf=args.min_samples_leaf,
+            activate=not args.no_activate
+        )
+        print("Model training completed!")